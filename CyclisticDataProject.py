@@ -47,12 +47,25 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from cyclistic.aggregate import aggregate_trips
+from cyclistic.cache import is_cached, load_cached_trips, store_cleaned_trips
+from cyclistic.density import ValueHistogram, histplot
+from cyclistic.features import REFERENCE_DATE, add_features
+from cyclistic.schema import apply_trip_schema
+
 
 # In[2]:
 
 
 # Load the dataset (Cyclistic trips from the 1st quarter of 2019).
-df = pd.read_csv(r"CyclisticData\Divvy_Trips_2019_Q1.csv")
+# When the Parquet cache (cell 14) holds the current version of the file, load the cleaned trips from it instead
+# of reading the CSV, and skip the conversions below; otherwise read the CSV and clean it.
+data_file = r"CyclisticData\Divvy_Trips_2019_Q1.csv"
+cached = is_cached(data_file)
+if cached:
+    df = load_cached_trips(sources=data_file)
+else:
+    df = pd.read_csv(data_file)
 
 
 # In[3]:
@@ -89,7 +102,8 @@ print(missing_values)
 
 
 # Fill missing gender values with 'Unknown' as the values are already strings, so filling them won't affect statistical analysis.
-df['gender'].fillna('Unknown', inplace=True)
+if not cached:
+    df['gender'].fillna('Unknown', inplace=True)
 
 
 # In[8]:
@@ -115,7 +129,8 @@ print(f"Missing birthyear percentage: {missing_birthyear_percentage:.2f}%")
 # If we try to convert 'tripduration' datatype from object to integer, an error would occur as some values contain ','.
 # To solve this, I'll strip 'tripduration' of commas before conversion.
 
-df['tripduration'] = df['tripduration'].str.replace(',', '')
+if not cached:
+    df['tripduration'] = df['tripduration'].str.replace(',', '')
 print(df['tripduration'])
 
 
@@ -123,7 +138,8 @@ print(df['tripduration'])
 
 
 # Converting tripduration data type to numeric.
-df['tripduration'] = pd.to_numeric(df['tripduration'])
+if not cached:
+    df['tripduration'] = pd.to_numeric(df['tripduration'])
 print(df['tripduration'])
 
 
@@ -131,15 +147,17 @@ print(df['tripduration'])
 
 
 # Convert 'start_time' and 'end_time' to datetime.
-df['start_time'] = pd.to_datetime(df['start_time'])
-df['end_time'] = pd.to_datetime(df['end_time'])
+if not cached:
+    df['start_time'] = pd.to_datetime(df['start_time'])
+    df['end_time'] = pd.to_datetime(df['end_time'])
 
 
 # In[12]:
 
 
 # Convert birthyear column to numeric, while coercing errors.
-df['birthyear'] = pd.to_numeric(df['birthyear'], errors='coerce')
+if not cached:
+    df['birthyear'] = pd.to_numeric(df['birthyear'], errors='coerce')
 
 
 # In[13]:
@@ -154,8 +172,19 @@ df.info()
 # In[14]:
 
 
-# Save the cleaned data to a new CSV file
-df.to_csv('cleaned_bicycle_data.csv', index=False)
+# Store the columns in compact types: categoricals for the text columns, the smallest integer widths that fit for the ids
+# and a nullable integer for 'birthyear'. This makes the frame several times smaller for the analysis below.
+# Trips loaded from the cache already have these types and the derived columns.
+if not cached:
+    df = apply_trip_schema(df, report=True)
+
+    # Derive 'start_hour', 'day_of_week' and 'age' once, as integer codes, for the analysis below.
+    # 'age' is counted from a fixed reference date (the end of 2019) so the results do not change from year to year.
+    df = add_features(df)
+
+    # Save the cleaned data to the Parquet cache (partitioned by year and quarter) instead of a CSV file,
+    # so the next run loads the typed, cleaned trips in cell 2 without cleaning them again.
+    store_cleaned_trips(df, data_file)
 
 
 # ## Exploratory Data Analysis
@@ -174,9 +203,13 @@ print(summary_stats)
 # In[16]:
 
 
+# Count the trip durations of each user type once (at a one second resolution).
+# The histograms and density curves below are drawn from these counts instead of from every single trip.
+duration_hist = ValueHistogram.from_values(df['tripduration'], df['usertype'])
+
 # Visualize the distribution of tripduration
 plt.figure(figsize=(10, 6))
-sns.histplot(df['tripduration'], bins=100, kde=True)
+histplot(duration_hist, bins=100)
 plt.title('Distribution of Trip Durations (in seconds)')
 plt.xlabel('Trip Duration (seconds)')
 plt.ylabel('Frequency')
@@ -190,7 +223,7 @@ plt.show()
 
 
 # Filter tripduration to be between 1 minute (60 seconds) and 1 hour (3600 seconds).
-filtered_df_1 = df[(df['tripduration'] > 60) & (df['tripduration'] < 3600)]
+filtered_durations = duration_hist.between(60, 3600, inclusive='neither')
 
 
 # In[18]:
@@ -198,7 +231,7 @@ filtered_df_1 = df[(df['tripduration'] > 60) & (df['tripduration'] < 3600)]
 
 # Visualize filtered tripduration
 plt.figure(figsize=(10, 6))
-sns.histplot(filtered_df_1['tripduration'], bins=100, kde=True)
+histplot(filtered_durations, bins=100)
 plt.title('Distribution of Trip Durations (in seconds) - Filtered')
 plt.xlabel('Trip Duration (seconds)')
 plt.ylabel('Frequency')
@@ -216,8 +249,7 @@ plt.show()
 
 # Trips by time of the day
 
-# Extract hour from start_time
-df['start_hour'] = df['start_time'].dt.hour
+# 'start_hour' was extracted from start_time in cell 14
 
 # Plot number of trips by hour of the day
 plt.figure(figsize=(10, 6))
@@ -275,6 +307,9 @@ plt.show()
 
 # Top 10 start stations
 top_start_stations = df['from_station_name'].value_counts().head(10)
+# apply_trip_schema (cell 14) made the station names categorical, and value_counts() keeps every category in
+# the index; keep the names of these ten stations as plain labels so only they are plotted.
+top_start_stations.index = top_start_stations.index.astype(str)
 print(top_start_stations)
 
 
@@ -300,6 +335,9 @@ plt.show()
 
 # Top 10 end stations
 top_end_stations = df['to_station_name'].value_counts().head(10)
+# apply_trip_schema (cell 14) made the station names categorical, and value_counts() keeps every category in
+# the index; keep the names of these ten stations as plain labels so only they are plotted.
+top_end_stations.index = top_end_stations.index.astype(str)
 print(top_end_stations)
 
 
@@ -328,8 +366,12 @@ plt.show()
 # In[26]:
 
 
-# Calculate mean trip duration for each user type
-mean_trip_duration = filtered_df_1.groupby('usertype')['tripduration'].mean()
+# All the user type breakdowns below are served from aggregates built in a single pass over the trips,
+# instead of running a separate groupby over the whole data frame for each of them.
+aggregates = aggregate_trips(df)
+
+# Calculate mean trip duration for each user type (over the filtered trips, between 1 minute and 1 hour).
+mean_trip_duration = aggregates.mean_trip_duration()
 print(mean_trip_duration)
 
 
@@ -343,7 +385,7 @@ print(mean_trip_duration)
 # Normalization is done to make the differences between the two user types clearer and more obvious as the number of trips taken by customers is very little compared to those taken by subscribers.
 
 plt.figure(figsize=(10, 6))
-sns.histplot(data=filtered_df_1, x='tripduration', hue='usertype', bins=50, kde=True, stat='density', common_norm=False)
+histplot(filtered_durations, bins=50, hue=True, stat='density')
 plt.title('Normalized Trip Duration Distribution by User Type')
 plt.xlabel('Trip Duration (seconds)')
 plt.ylabel('Density')
@@ -361,18 +403,9 @@ plt.show()
 
 # Trip duration by day of the week
 
-# Calculate the day of the week
-df['day_of_week'] = df['start_time'].dt.day_name()
-
-# Ensure the days of the week are ordered correctly.
-days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-df['day_of_week'] = pd.Categorical(df['day_of_week'], categories=days_order, ordered=True)
-
-# Aggregating the data to find mean trip duration by day of the week and user type
-mean_tripduration_by_day_usertype = df.groupby(['day_of_week', 'usertype'])['tripduration'].mean().reset_index()
-
-# Sorting the days of the week to ensure correct order
-mean_tripduration_by_day_usertype = mean_tripduration_by_day_usertype.sort_values('day_of_week')
+# Mean trip duration by day of the week and user type.
+# The days of the week are an ordered categorical, so they are already sorted in the correct order.
+mean_tripduration_by_day_usertype = aggregates.mean_tripduration_by_day_usertype()
 
 # Plotting
 # Make the size of the graph bigger as it contains more dense and tall bars.
@@ -395,9 +428,8 @@ plt.show()
 
 # Peak Hours for Trips by User Type (Normalized):
 
-# Normalize counts by user type
-hourly_counts = df.groupby(['usertype', 'start_hour']).size().reset_index(name='counts')
-hourly_counts['percent'] = hourly_counts.groupby('usertype')['counts'].apply(lambda x: x / x.sum() * 100)
+# Counts by user type and hour, normalized by the total number of trips of each user type.
+hourly_counts = aggregates.hourly_counts()
 
 # Visualizing.
 plt.figure(figsize=(10, 6))
@@ -420,22 +452,10 @@ plt.show()
 
 # Analyzing the number of trips taken at each day of the week for each usertype.
 
-# Grouping by the two columns 'day_of_week' & 'usertype'.
-trips_by_day_usertype = df.groupby(['day_of_week', 'usertype']).agg({'trip_id':['count']}).reset_index()
-
-# Adding names to the columns to be able to visualize them.
-trips_by_day_usertype.columns = ['day_of_week', 'usertype', 'trip_count']
-
-# Group by day of the week to get the total number of trips per day.
-total_trips_per_day = df.groupby('day_of_week').agg({'trip_id': 'count'}).reset_index()
-total_trips_per_day.columns = ['day_of_week', 'total_trip_count']
-
-# Merge the data frames to include the total trips per day.
-trips_by_day_usertype = pd.merge(trips_by_day_usertype, total_trips_per_day, on='day_of_week')
-
-# Calculating the proportion of trips taken by each user type of the total number of trips in each day of the week
+# Number of trips for each day of the week & user type ('trip_count'), the total number of trips per day ('total_trip_count'),
+# and the proportion of trips taken by each user type of the total number of trips in each day of the week
 # (Normalization is done to make the two usertypes visualizations comparable).
-trips_by_day_usertype['proportion_of_trips'] = trips_by_day_usertype['trip_count'] / trips_by_day_usertype['total_trip_count']
+trips_by_day_usertype = aggregates.trips_by_day_usertype()
 
 # Visualize the analysis
 # Make the size of the graph bigger as it contains more dense and tall bars.
@@ -491,8 +511,7 @@ plt.show()
 
 
 # Most popular start stations
-popular_start_stations = df.groupby(['usertype', 'from_station_name'])['trip_id'].count().reset_index().sort_values(by='trip_id', ascending=False).groupby('usertype').head(10)
-popular_start_stations.columns = ['User type','From station name','Trip Count']
+popular_start_stations = aggregates.popular_start_stations(10)
 print(popular_start_stations)
 
 
@@ -500,8 +519,7 @@ print(popular_start_stations)
 
 
 # Most popular end stations
-popular_end_stations = df.groupby(['usertype', 'to_station_name'])['trip_id'].count().reset_index().sort_values(by='trip_id', ascending=False).groupby('usertype').head(10)
-popular_end_stations.columns = ['User type','To station name','Trip Count']
+popular_end_stations = aggregates.popular_end_stations(10)
 print(popular_end_stations)
 
 
@@ -514,7 +532,7 @@ print(popular_end_stations)
 
 
 # Calculate percentage of missing birthyear values for each usertype
-unknown_birthyear_percentages = df.groupby('usertype')['birthyear'].apply(lambda x: (x.isna()).mean() * 100)
+unknown_birthyear_percentages = aggregates.unknown_birthyear_percentages()
 print(unknown_birthyear_percentages)
 
 
@@ -524,13 +542,9 @@ print(unknown_birthyear_percentages)
 # In[35]:
 
 
-# Creating a new column 'age' based on 'birthyear' to check for the age distribution of users.
-
-# Calculating this year to be able to calculate 'age' correctly.
-current_year = pd.Timestamp.now().year
-
-# Calculating 'age' by extracting 'current_year' from 'birthyear'
-df['age'] = current_year - df['birthyear']
+# The 'age' column was derived from 'birthyear' in cell 14, to check for the age distribution of users.
+# It is the age reached in the year of the reference date, so missing birthyears stay missing.
+print(f"Ages as of {REFERENCE_DATE.year}")
 
 
 # In[36]:
@@ -544,7 +558,7 @@ print(df['age'].describe())
 
 
 # Filter the 'age' data to only include people under 90 (removing outliers):
-df_filtered_2 = df[df['age'] <= 90.0]
+age_hist = ValueHistogram.from_values(df['age'], df['usertype']).between(right=90.0)
 
 
 # In[38]:
@@ -553,7 +567,7 @@ df_filtered_2 = df[df['age'] <= 90.0]
 #Although 'Customer' data is missing a lot of 'birthyear' values and therefore also 'age' values, we'll work with the data that we have
 #Age Distribution by User Type:
 plt.figure(figsize=(10, 6))
-sns.histplot(data= df_filtered_2, x= df_filtered_2['age'], hue= df_filtered_2['usertype'], kde=True, bins=30, stat = 'density', common_norm=False)
+histplot(age_hist, bins=30, hue=True, stat='density')
 plt.title('Normalized Age Distribution by User Type')
 plt.xlabel('Age')
 plt.ylabel('Frequency')
@@ -573,8 +587,7 @@ plt.show()
 
 
 # Calculate gender percentages by user type
-gender_user_type = df.groupby(['usertype', 'gender']).size().unstack().fillna(0)
-gender_user_type = gender_user_type.div(gender_user_type.sum(axis=1), axis=0) * 100
+gender_user_type = aggregates.gender_user_type()
 
 # Create pie charts
 fig, axes = plt.subplots(1, 2, figsize=(14, 7))
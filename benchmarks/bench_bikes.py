@@ -0,0 +1,86 @@
+# Benchmark: bike-level sweeps (cyclistic.bikes) vs pandas groupby over the bikes.
+#
+# Synthetic trips (bike ids, start/end times, stations) are generated directly as arrays,
+# since only five columns are needed. Idle gaps, teleports and daily ride time are computed
+# with BikeTrips and with the pandas way (sort_values, then groupby('bikeid').shift() and a
+# groupby over (bikeid, date)); both are checked to agree and timed. The pandas daily ride
+# time does not split trips crossing midnight, so only the days no such trip touches are compared.
+#
+# Usage: python benchmarks/bench_bikes.py [rows]
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.bikes import BikeTrips
+from cyclistic.synthetic import N_BIKES, N_STATIONS
+
+
+def synthetic_trips(rows, days=365, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2019-01-01') + pd.to_timedelta(np.sort(rng.integers(0, days * 86400, rows)), unit='s')
+    duration = pd.to_timedelta(np.round(rng.lognormal(6.5, 0.8, rows)) + 61, unit='s')
+    return pd.DataFrame({
+        'bikeid': rng.integers(1, N_BIKES + 1, rows),
+        'start_time': start,
+        'end_time': start + duration,
+        'from_station_id': rng.integers(2, N_STATIONS + 2, rows),
+        'to_station_id': rng.integers(2, N_STATIONS + 2, rows),
+    })
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:>28}: {time.perf_counter() - start:6.2f} s')
+    return result
+
+
+def pandas_sweeps(df):
+    trips = df.sort_values(['bikeid', 'start_time'], kind='stable')
+    following = trips.groupby('bikeid')[['start_time', 'from_station_id']].shift(-1)
+    has_next = following['start_time'].notna()
+    idle = (following['start_time'] - trips['end_time']).dt.total_seconds()[has_next]
+    teleports = int((trips['to_station_id'] != following['from_station_id'])[has_next].sum())
+    daily = (trips['end_time'] - trips['start_time']).dt.total_seconds().groupby(
+        [trips['bikeid'], trips['start_time'].dt.normalize()]).sum()
+    return idle.to_numpy(), teleports, daily
+
+
+def bike_sweeps(df):
+    bikes = BikeTrips.from_trips(df)
+    gaps = bikes.gaps()
+    return gaps['idle_seconds'].to_numpy(), int(gaps['teleport'].sum()), bikes.daily_utilization()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    df = synthetic_trips(rows)
+    print(f'{rows:,} trips, {N_BIKES:,} bikes')
+
+    idle, teleports, daily = timed('BikeTrips', lambda: bike_sweeps(df))
+    ref_idle, ref_teleports, ref_daily = timed('pandas groupby', lambda: pandas_sweeps(df))
+
+    assert np.array_equal(np.sort(idle), np.sort(ref_idle.astype(np.int64)))
+    assert teleports == ref_teleports
+    crosses = df['end_time'].dt.normalize() != df['start_time'].dt.normalize()
+    split_days = pd.MultiIndex.from_arrays([
+        pd.concat([df['bikeid'][crosses]] * 2),
+        pd.concat([df['start_time'][crosses].dt.normalize(), df['end_time'][crosses].dt.normalize()]),
+    ])
+    ours = daily.set_index(['bikeid', 'date'])['ride_seconds']
+    ours.index = ours.index.set_levels(pd.to_datetime(ours.index.levels[1]).as_unit('ns'), level=1)
+    ref_daily = ref_daily[~ref_daily.index.isin(split_days)]
+    assert np.array_equal(ours.reindex(ref_daily.index).to_numpy(), ref_daily.to_numpy().astype(np.int64))
+    print(f'{teleports:,} teleports; idle gaps and daily ride time agree')
+
+    timed('BikeTrips.bike_summary', lambda: BikeTrips.from_trips(df).bike_summary())
+
+
+if __name__ == '__main__':
+    main()
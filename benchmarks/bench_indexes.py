@@ -0,0 +1,105 @@
+# Benchmark: station, user type and date lookups through the column store indexes vs full scans.
+#
+# Synthetic trips are cleaned and written, one quarter at a time, into a column store
+# (cyclistic.columnstore), whose indexes are built with the first quarter and then updated
+# with the others. Each lookup is run three ways, checked to select the same trips and
+# timed:
+#
+#   frame    boolean masks over the whole cleaned DataFrame (the notebook's way)
+#   scan     the column store without its indexes (one full scan of a column)
+#   indexed  the column store's sorted indexes
+#
+# Usage: python benchmarks/bench_indexes.py [rows]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.columnstore import ColumnStore
+from cyclistic.features import add_features
+from cyclistic.loader import clean_trips
+from cyclistic.schema import apply_trip_schema, concat_trips
+from cyclistic.synthetic import generate_trips
+
+
+def quarters(rows, n_quarters=4):
+    """Cleaned synthetic trips, one frame per quarter of 2019."""
+    starts = pd.date_range('2019-01-01', periods=n_quarters, freq='QS')
+    first_trip_id = 21_742_443
+    for i, start in enumerate(starts):
+        n = rows // n_quarters
+        raw = generate_trips(n, start=start.strftime('%Y-%m-%d'), days=90, seed=i, first_trip_id=first_trip_id)
+        first_trip_id += n
+        yield add_features(apply_trip_schema(clean_trips(raw)))
+
+
+def lookups(df):
+    """(name, frame mask, column store conditions, post-processing of the selected trips)."""
+    station = int(df['from_station_id'].value_counts().index[50])
+    day = df['start_time'].dt.normalize().value_counts().index[10]
+    return [
+        ('hourly profile of one start station',
+         lambda: df['from_station_id'] == station,
+         dict(from_station_id=station),
+         lambda trips: np.bincount(trips['start_hour'].to_numpy(dtype=np.int64), minlength=24)),
+        ("one day's Customer trips",
+         lambda: (df['start_time'].dt.normalize() == day) & (df['usertype'] == 'Customer'),
+         dict(start_date=day.strftime('%Y-%m-%d'), usertype='Customer'),
+         lambda trips: trips['trip_id'].to_numpy()),
+        ('Customer trips ending at one station',
+         lambda: (df['to_station_id'] == station) & (df['usertype'] == 'Customer'),
+         dict(to_station_id=station, usertype='Customer'),
+         lambda trips: trips['tripduration'].mean()),
+    ]
+
+
+def timed(func, repeat=3):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(rows=4_000_000):
+    store_dir = tempfile.mkdtemp(prefix='trip_columns_')
+    try:
+        store = ColumnStore(store_dir)
+        frames = []
+        build = update = 0.0
+        for i, quarter in enumerate(quarters(rows)):
+            frames.append(quarter)
+            start = time.perf_counter()
+            store.append(quarter)
+            store.indexes.update()
+            if i == 0:
+                build = time.perf_counter() - start
+            else:
+                update += time.perf_counter() - start
+        df = concat_trips(frames)
+        print(f'rows: {len(store):,}; first quarter stored and indexed in {build:.2f} s, '
+              f'3 more quarters appended and merged into the indexes in {update:.2f} s')
+
+        columns = ['trip_id', 'start_hour', 'tripduration']
+        for name, mask, conditions, result in lookups(df):
+            frame_time, expected = timed(lambda: result(df[mask()]))
+            scan_time, scanned = timed(lambda: result(store.select(columns, use_indexes=False, **conditions)))
+            index_time, indexed = timed(lambda: result(store.select(columns, **conditions)))
+            np.testing.assert_allclose(scanned, expected, rtol=1e-6)
+            np.testing.assert_allclose(indexed, expected, rtol=1e-6)
+            print(f'{name}: frame {frame_time * 1000:.1f} ms, scan {scan_time * 1000:.1f} ms, '
+                  f'indexed {index_time * 1000:.1f} ms ({frame_time / index_time:.0f}x faster than the frame)')
+    finally:
+        shutil.rmtree(store_dir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4_000_000)
@@ -0,0 +1,130 @@
+# Benchmark and equivalence check: per-group normalizations (cells 29, 30, 34 and 39).
+#
+# "before" is the notebook's original code, with groupby(...).apply(lambda ...) in cells 29
+# and 34 (cell 29 needs group_keys=False to align on pandas >= 2). "after" is the same
+# tables built with the vectorized helpers from cyclistic.aggregate, on the same frame, and
+# "engine" is the single-pass TripAggregates path the notebook now uses. All three are
+# checked to give the same tables before the timings are printed; with --check, only the
+# equivalence is checked (on a small frame, without timings), e.g. after changing the helpers.
+#
+# Usage: python benchmarks/bench_normalization.py [rows]
+#        python benchmarks/bench_normalization.py --check [rows]
+
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.aggregate import DAYS_ORDER, aggregate_trips, group_total, share_within
+from cyclistic.loader import clean_trips
+from cyclistic.schema import apply_trip_schema
+from cyclistic.synthetic import generate_trips
+
+
+def prepare(df):
+    df['start_hour'] = df['start_time'].dt.hour
+    df['day_of_week'] = pd.Categorical(df['start_time'].dt.day_name(), categories=DAYS_ORDER, ordered=True)
+    return df
+
+
+def before(df):
+    hourly_counts = df.groupby(['usertype', 'start_hour'], observed=True).size().reset_index(name='counts')
+    hourly_counts['percent'] = hourly_counts.groupby('usertype', observed=True, group_keys=False)['counts'] \
+        .apply(lambda x: x / x.sum() * 100)
+
+    trips_by_day_usertype = df.groupby(['day_of_week', 'usertype'], observed=True).agg({'trip_id': ['count']}).reset_index()
+    trips_by_day_usertype.columns = ['day_of_week', 'usertype', 'trip_count']
+    total_trips_per_day = df.groupby('day_of_week', observed=True).agg({'trip_id': 'count'}).reset_index()
+    total_trips_per_day.columns = ['day_of_week', 'total_trip_count']
+    trips_by_day_usertype = pd.merge(trips_by_day_usertype, total_trips_per_day, on='day_of_week')
+    trips_by_day_usertype['proportion_of_trips'] = \
+        trips_by_day_usertype['trip_count'] / trips_by_day_usertype['total_trip_count']
+
+    unknown_birthyear = df.groupby('usertype', observed=True)['birthyear'].apply(lambda x: (x.isna()).mean() * 100)
+
+    gender_user_type = df.groupby(['usertype', 'gender'], observed=True).size().unstack().fillna(0)
+    gender_user_type = gender_user_type.div(gender_user_type.sum(axis=1), axis=0) * 100
+    return hourly_counts, trips_by_day_usertype, unknown_birthyear, gender_user_type
+
+
+def after(df):
+    hourly_counts = df.groupby(['usertype', 'start_hour'], observed=True).size().reset_index(name='counts')
+    hourly_counts['percent'] = share_within(hourly_counts['counts'], hourly_counts['usertype'])
+
+    trips_by_day_usertype = df.groupby(['day_of_week', 'usertype'], observed=True).size().reset_index(name='trip_count')
+    trips_by_day_usertype['total_trip_count'] = group_total(trips_by_day_usertype['trip_count'],
+                                                            trips_by_day_usertype['day_of_week'])
+    trips_by_day_usertype['proportion_of_trips'] = share_within(trips_by_day_usertype['trip_count'],
+                                                                trips_by_day_usertype['day_of_week'], scale=1)
+
+    unknown_birthyear = df['birthyear'].isna().groupby(df['usertype'], observed=True).mean() * 100
+
+    gender_counts = df.groupby(['usertype', 'gender'], observed=True).size()
+    gender_user_type = share_within(gender_counts, gender_counts.index.get_level_values('usertype')).unstack().fillna(0)
+    return hourly_counts, trips_by_day_usertype, unknown_birthyear, gender_user_type
+
+
+def engine(df):
+    aggregates = aggregate_trips(df)
+    return (aggregates.hourly_counts(), aggregates.trips_by_day_usertype(),
+            aggregates.unknown_birthyear_percentages(), aggregates.gender_user_type())
+
+
+def assert_same(expected, result, name):
+    for left, right in zip(expected, result):
+        if isinstance(left, pd.DataFrame):
+            # gender columns come out in category order on the engine path
+            right = right[list(left.columns)]
+            left, right = left.reset_index(drop=True), right.reset_index(drop=True)
+            left.columns, right.columns = list(left.columns), list(right.columns)
+            pd.testing.assert_frame_equal(left, right, check_dtype=False, check_categorical=False, obj=name)
+        else:
+            pd.testing.assert_series_equal(left, right, check_dtype=False, check_names=False,
+                                           check_index_type=False, check_categorical=False, obj=name)
+
+
+def best_of(func, df, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def trips(rows):
+    return prepare(apply_trip_schema(clean_trips(generate_trips(rows))))
+
+
+def check(rows=50_000):
+    """Check that the three paths give the same tables, without timing them."""
+    df = trips(rows)
+    expected = before(df)
+    assert_same(expected, after(df), 'after')
+    assert_same(expected, engine(df), 'engine')
+    print(f'rows: {rows:,} (all three paths give the same tables)')
+
+
+def main(rows=5_000_000):
+    df = trips(rows)
+
+    before_time, expected = best_of(before, df)
+    after_time, result = best_of(after, df)
+    engine_time, served = best_of(engine, df)
+    assert_same(expected, result, 'after')
+    assert_same(expected, served, 'engine')
+
+    print(f'rows: {rows:,} (all three paths give the same tables)')
+    print(f'before (groupby.apply):      {before_time:.3f} s')
+    print(f'after (vectorized helpers):  {after_time:.3f} s  ({before_time / after_time:.1f}x)')
+    print(f'engine (TripAggregates):     {engine_time:.3f} s  ({before_time / engine_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--check']:
+        check(*map(int, sys.argv[2:3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000)
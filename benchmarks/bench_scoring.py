@@ -0,0 +1,82 @@
+# Benchmark: scoring station-hour cells for conversion campaigns (cyclistic.scoring).
+#
+# Synthetic Customer features are drawn for millions of (station, hour) cells and ranked
+# with score_features(), which standardizes the features and scores all cells with one
+# matrix product. A sample of the cells is also scored one row at a time in Python, the
+# straightforward way, to check the scores and to compare the cost per cell.
+#
+# Usage: python benchmarks/bench_scoring.py [cells]
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.scoring import MIN_CUSTOMER_TRIPS, SCORE_WEIGHTS, score_features
+
+
+SAMPLE = 20_000
+
+
+def synthetic_features(cells, seed=0):
+    rng = np.random.default_rng(seed)
+    trips = rng.integers(1, 2_000, cells)
+    customer_trips = rng.binomial(trips, rng.uniform(0, 0.6, cells))
+    young_share = rng.uniform(0, 1, cells)
+    young_share[rng.uniform(size=cells) < 0.05] = np.nan
+    return pd.DataFrame({
+        'from_station_id': np.arange(cells) // 24,
+        'hour': np.arange(cells) % 24,
+        'trips': trips,
+        'customer_trips': customer_trips,
+        'customer_share': customer_trips / trips,
+        'weekend_share': rng.uniform(0, 1, cells),
+        'mean_duration': rng.gamma(4, 400, cells),
+        'young_share': young_share,
+    })
+
+
+def row_scores(features, weights=SCORE_WEIGHTS):
+    """Score every cell with a Python loop over the rows, as a reference."""
+    rows = [row for row in features.to_dict('records') if row['customer_trips'] >= MIN_CUSTOMER_TRIPS]
+    for row in rows:
+        row['customer_trips'] = np.log1p(row['customer_trips'])
+    stats = {}
+    for column in weights:
+        values = [row[column] for row in rows if not np.isnan(row[column])]
+        stats[column] = (np.mean(values), np.std(values))
+    scores = []
+    for row in rows:
+        score = 0.0
+        for column, weight in weights.items():
+            mean, std = stats[column]
+            if not np.isnan(row[column]):
+                score += weight * (row[column] - mean) / (std if std > 0 else 1)
+        scores.append(score)
+    return np.sort(scores)[::-1]
+
+
+def main():
+    cells = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    features = synthetic_features(cells)
+
+    start = time.perf_counter()
+    ranked = score_features(features)
+    vectorized = time.perf_counter() - start
+    print(f'score_features: {cells:,} cells ({len(ranked):,} ranked) in {vectorized:.2f} s')
+
+    sample = features.head(SAMPLE)
+    start = time.perf_counter()
+    reference = row_scores(sample)
+    loop = time.perf_counter() - start
+    assert np.allclose(score_features(sample)['score'].to_numpy(), reference)
+    print(f'row by row: {len(sample):,} cells in {loop:.2f} s '
+          f'(about {loop / len(sample) * cells:.0f} s for {cells:,} cells)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Benchmark: startup time of the command line entry point (python -m cyclistic).
+#
+# Small synthetic quarterly files are ingested into a temporary directory, then every
+# non-plotting command is run in a fresh interpreter. Its wall time (interpreter start,
+# imports and a small amount of work) is compared with cli.STARTUP_BUDGET, and the modules
+# it loaded are checked for matplotlib and seaborn. Exits with status 1 if a command is over
+# the budget or loaded a plotting library.
+#
+# Usage: python benchmarks/bench_startup.py [repeats]
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.cli import PLOTTING_MODULES, STARTUP_BUDGET
+from cyclistic.synthetic import write_trips_csv
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+COMMANDS = [
+    ['--help'],
+    ['query', '--help'],
+    ['query', '--metric', 'hourly_profile', '--usertype', 'Customer', '--station', '5'],
+    ['aggregate', '--tables', 'trips_by_usertype'],
+]
+
+# Runs a command and reports, on the last line of stderr, which plotting modules it imported.
+RUNNER = f'''
+import sys
+from cyclistic.cli import main
+try:
+    main(sys.argv[1:])
+except SystemExit:
+    pass
+print('loaded:', ','.join(m for m in {PLOTTING_MODULES!r} if m in sys.modules), file=sys.stderr)
+'''
+
+
+def run_command(args, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    done = subprocess.run([sys.executable, '-c', RUNNER, *args], cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    loaded = done.stderr.strip().splitlines()[-1].removeprefix('loaded:').strip()
+    return elapsed, [m for m in loaded.split(',') if m]
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    tmp = tempfile.mkdtemp()
+    try:
+        data_dir = os.path.join(tmp, 'data')
+        os.makedirs(data_dir)
+        write_trips_csv(os.path.join(data_dir, 'Divvy_Trips_2019_Q1.csv'), 20_000)
+        subprocess.run([sys.executable, '-m', 'cyclistic', 'ingest', data_dir, '--targets', 'columns', 'aggregates'],
+                       cwd=tmp, env=dict(os.environ, PYTHONPATH=ROOT), check=True, capture_output=True)
+
+        failed = False
+        print(f'startup budget: {STARTUP_BUDGET:.2f} s')
+        for args in COMMANDS:
+            times, loaded = [], []
+            for _ in range(repeats):
+                elapsed, loaded = run_command(args, tmp)
+                times.append(elapsed)
+            best = min(times)
+            ok = best <= STARTUP_BUDGET and not loaded
+            failed |= not ok
+            note = f'  loaded {", ".join(loaded)}' if loaded else ''
+            print(f'{"ok  " if ok else "FAIL"} {best:5.2f} s  python -m cyclistic {" ".join(args)}{note}')
+    finally:
+        shutil.rmtree(tmp)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Benchmark: fixed-layout timestamp parsing vs pd.to_datetime.
+#
+# Writes a synthetic year of Divvy-style 'start_time'/'end_time' values to a CSV file
+# (about 3.8 million trips, the size of the 2019 data), reads it back as text and times
+# both parsing paths on it.
+#
+# Usage: python benchmarks/bench_timestamps.py [rows]
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.loader import parse_timestamps
+
+
+def make_timestamps_csv(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2019-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 365 * 86400, rows)), unit='s')
+    end = start + pd.to_timedelta(rng.exponential(800, rows).astype(np.int64) + 60, unit='s')
+    pd.DataFrame({
+        'start_time': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'end_time': end.strftime('%Y-%m-%d %H:%M:%S'),
+    }).to_csv(path, index=False)
+
+
+def best_of(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(rows=3_800_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'timestamps.csv')
+        make_timestamps_csv(path, rows)
+        df = pd.read_csv(path, dtype=str)
+
+    generic, expected = best_of(lambda: pd.to_datetime(df['start_time']))
+    fast, result = best_of(lambda: parse_timestamps(df['start_time']))
+    pd.testing.assert_series_equal(result, expected, check_dtype=False)
+
+    print(f'rows: {rows:,}')
+    print(f'pd.to_datetime:   {generic:.3f} s')
+    print(f'parse_timestamps: {fast:.3f} s')
+    print(f'speedup:          {generic / fast:.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3_800_000)
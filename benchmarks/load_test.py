@@ -0,0 +1,150 @@
+# Load test: latency of the query service (cyclistic.server) under concurrent clients.
+#
+# A column store of synthetic trips is built in a temporary directory (or --store is used),
+# the service is started in a subprocess, and --clients concurrent asyncio clients send
+# --requests queries each over keep-alive connections. The queries are drawn from a fixed
+# set of variants, so the run starts with cache misses and ends mostly with cache hits.
+# Latency percentiles are reported for the cold pass (first time each query is asked) and
+# for a second, identical pass served from the cache.
+#
+# Usage: python benchmarks/load_test.py [--rows 1000000] [--clients 20] [--requests 50]
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.columnstore import ColumnStore, build_column_store
+from cyclistic.server import HOST, METRICS
+from cyclistic.synthetic import write_trips_csv
+
+
+PORT = 8051
+
+
+def query_variants(store, n=200, seed=0):
+    """`n` distinct parameter sets, like the variants of the notebook's questions."""
+    rng = np.random.default_rng(seed)
+    station_ids = np.unique(store.keys('from_station_id'))
+    months = ['2019-01', '2019-02', '2019-03']
+    variants = set()
+    while len(variants) < n:
+        params = {'metric': str(rng.choice(sorted(METRICS)))}
+        if rng.random() < 0.8:
+            params['usertype'] = str(rng.choice(['Customer', 'Subscriber']))
+        if rng.random() < 0.7:
+            params['station'] = str(int(rng.choice(station_ids)))
+        if rng.random() < 0.5:
+            month = str(rng.choice(months))
+            params['start'], params['end'] = f'{month}-01', f'{month}-28'
+        variants.add(tuple(sorted(params.items())))
+    return [dict(v) for v in sorted(variants)]
+
+
+async def get(reader, writer, target):
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: {HOST}\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, json.loads(body)
+
+
+async def client(queries, latencies):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    for params in queries:
+        target = '/query?' + urllib.parse.urlencode(params)
+        start = time.perf_counter()
+        status, _ = await get(reader, writer, target)
+        latencies.append(time.perf_counter() - start)
+        assert status == 200, (status, target)
+    writer.close()
+
+
+async def run_pass(workload):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(queries, latencies) for queries in workload))
+    return np.array(latencies), time.perf_counter() - start
+
+
+async def stats():
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    _, body = await get(reader, writer, '/stats')
+    writer.close()
+    return body
+
+
+def report(name, latencies, elapsed):
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    print(f'{name:>7}: {len(latencies):,} requests in {elapsed:.2f} s ({len(latencies) / elapsed:,.0f}/s)  '
+          f'p50 {p50:.1f} ms  p90 {p90:.1f} ms  p99 {p99:.1f} ms  max {latencies.max() * 1000:.1f} ms')
+
+
+async def wait_for_server(timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(HOST, PORT)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=50, help='requests per client')
+    parser.add_argument('--store', help='an existing column store (default: build one from synthetic trips)')
+    args = parser.parse_args()
+
+    tmp = None
+    store_dir = args.store
+    if store_dir is None:
+        tmp = tempfile.mkdtemp()
+        store_dir = os.path.join(tmp, 'trip_columns')
+        build_column_store(write_trips_csv(os.path.join(tmp, 'Divvy_Trips_2019_Q1.csv'), args.rows), store_dir)
+
+    variants = query_variants(ColumnStore(store_dir))
+    rng = np.random.default_rng(1)
+    workload = [[variants[i] for i in rng.integers(0, len(variants), args.requests)] for _ in range(args.clients)]
+
+    root = os.path.join(os.path.dirname(__file__), '..')
+    server = subprocess.Popen([sys.executable, '-c', f'from cyclistic.server import serve; '
+                                                     f'serve({store_dir!r}, {HOST!r}, {PORT})'], cwd=root)
+    try:
+        asyncio.run(wait_for_server())
+        print(f'{args.clients} clients x {args.requests} requests, {len(variants)} query variants')
+        report('cold', *asyncio.run(run_pass(workload)))
+        report('cached', *asyncio.run(run_pass(workload)))
+        print('cache:', asyncio.run(stats()))
+    finally:
+        server.terminate()
+        server.wait()
+        if tmp:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
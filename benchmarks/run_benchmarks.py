@@ -0,0 +1,233 @@
+# Benchmark suite: times every stage of the analysis on synthetic Divvy-shaped data.
+#
+# For each size (1M, 10M and 100M trips by default) a seeded synthetic CSV is generated once
+# into --data-dir, then loading, cleaning, every analysis cell and every plot of the notebook
+# are timed. The chunks are streamed into the aggregates and histograms the tables and
+# figures are drawn from, so memory stays bounded by the chunk size at every size. Wall time
+# and peak RSS of each stage are appended to --results (JSON lines), and compared with the
+# previous run of the same stage and size.
+#
+# Usage: python benchmarks/run_benchmarks.py [--sizes 1000000,10000000] [--data-dir DIR]
+
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cyclistic.aggregate import aggregate_trips
+from cyclistic.density import ValueHistogram
+from cyclistic.features import ages
+from cyclistic.figures import FIGURES, figure_tables
+from cyclistic.instrument import current_rss
+from cyclistic.loader import CHUNK_SIZE, clean_trips, iter_raw_chunks
+from cyclistic.schema import apply_trip_schema
+from cyclistic.synthetic import write_trips_csv
+
+
+DEFAULT_SIZES = [1_000_000, 10_000_000, 100_000_000]
+RESULTS = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+
+class PeakRSS:
+    """Context manager sampling the RSS in a background thread to find a stage's peak."""
+
+    interval = 0.005
+
+    def __enter__(self):
+        self.start = current_rss()
+        self.peak = self.start or 0
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, current_rss() or 0)
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        if self.start is None:
+            # No /proc: fall back to the process-wide high-water mark (kilobytes on Linux).
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        else:
+            self.peak = max(self.peak, current_rss() or 0)
+
+
+class Recorder:
+    def __init__(self, rows, run):
+        self.rows = rows
+        self.run = run
+        self.records = []
+
+    def stage(self, name, func, *args):
+        """Run func(*args) as a timed stage and return its result."""
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            result = func(*args)
+            wall = time.perf_counter() - start
+        self.add(name, wall, rss.peak)
+        return result
+
+    def add(self, name, wall, peak_rss):
+        record = dict(self.run, rows=self.rows, stage=name, wall_s=round(wall, 4), peak_rss_mb=round(peak_rss / 2**20, 1))
+        self.records.append(record)
+        print(f'{self.rows:>12,}  {name:<42} {wall:9.3f} s {record["peak_rss_mb"]:10.1f} MB', flush=True)
+
+
+def load_and_aggregate(path, recorder, chunksize):
+    """Stream the file into the aggregates and histograms; reading, cleaning and aggregating
+    are timed separately, chunk by chunk, and no more than one chunk of trips is held in memory."""
+    read_time = clean_time = aggregate_time = 0.0
+    aggregates = None
+    histograms = {'tripduration': ValueHistogram(), 'age': ValueHistogram()}
+    with PeakRSS() as rss:
+        raw_chunks = iter_raw_chunks(path, chunksize=chunksize)
+        while True:
+            start = time.perf_counter()
+            raw = next(raw_chunks, None)
+            read_time += time.perf_counter() - start
+            if raw is None:
+                break
+            start = time.perf_counter()
+            chunk = apply_trip_schema(clean_trips(raw))
+            clean_time += time.perf_counter() - start
+            start = time.perf_counter()
+            partial = aggregate_trips(chunk)
+            aggregates = partial if aggregates is None else aggregates.merge(partial)
+            histograms['tripduration'].update(chunk['tripduration'], chunk['usertype'])
+            histograms['age'].update(ages(chunk['birthyear']), chunk['usertype'])
+            aggregate_time += time.perf_counter() - start
+    recorder.add('load (read_csv)', read_time, rss.peak)
+    recorder.add('clean (cells 7-12 + schema)', clean_time, rss.peak)
+    recorder.add('aggregate (cells 16-39)', aggregate_time, rss.peak)
+    return aggregates, histograms
+
+
+def analysis_stages(aggregates, histograms):
+    """The tables of the notebook's analysis cells, as (name, function) pairs run in order."""
+    state = {}
+
+    def tables():
+        state['tables'] = figure_tables(aggregates, histograms)
+
+    def table(name, *args):
+        return lambda: getattr(aggregates, name)(*args)
+
+    return state, [
+        ('cell 19 trips_by_hour', table('trips_by_hour')),
+        ('cell 22 top_start_stations', table('top_start_stations', 10)),
+        ('cell 24 top_end_stations', table('top_end_stations', 10)),
+        ('cell 26 mean_trip_duration', table('mean_trip_duration')),
+        ('cell 28 mean_tripduration_by_day_usertype', table('mean_tripduration_by_day_usertype')),
+        ('cell 29 hourly_counts', table('hourly_counts')),
+        ('cell 30 trips_by_day_usertype', table('trips_by_day_usertype')),
+        ('cell 32 popular_start_stations', table('popular_start_stations')),
+        ('cell 33 popular_end_stations', table('popular_end_stations')),
+        ('cell 34 unknown_birthyear_percentages', table('unknown_birthyear_percentages')),
+        ('cell 39 gender_user_type', table('gender_user_type')),
+        ('figure tables', tables),
+    ]
+
+
+def plot_stages(state):
+    """The notebook's figures (cyclistic.figures), each drawn on the Agg backend and closed."""
+    def figure(draw):
+        def run():
+            fig = draw(state['tables'])
+            fig.canvas.draw()
+            plt.close(fig)
+        return run
+
+    return [(f'cell {cell} plot {name}', figure(draw)) for name, cell, draw in FIGURES]
+
+
+def benchmark_size(rows, data_dir, run, chunksize):
+    path = os.path.join(data_dir, f'synthetic_trips_{rows}.csv')
+    if not os.path.exists(path):
+        print(f'Generating {rows:,} synthetic trips into {path} ...', flush=True)
+        write_trips_csv(path + '.tmp', rows)
+        os.replace(path + '.tmp', path)
+
+    recorder = Recorder(rows, run)
+    aggregates, histograms = load_and_aggregate(path, recorder, chunksize)
+    state, stages = analysis_stages(aggregates, histograms)
+    for name, func in stages:
+        recorder.stage(name, func)
+    for name, func in plot_stages(state):
+        recorder.stage(name, func)
+    return recorder.records
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(records, previous):
+    """Print the change of every stage against the latest earlier run of the same stage and size."""
+    last = {}
+    for record in previous:
+        last[(record['rows'], record['stage'])] = record
+    print('\nChange against the previous run:')
+    for record in records:
+        before = last.get((record['rows'], record['stage']))
+        if before is None or not before['wall_s']:
+            continue
+        change = (record['wall_s'] - before['wall_s']) / before['wall_s'] * 100
+        print(f'{record["rows"]:>12,}  {record["stage"]:<42} {change:+7.1f} % (was {before["wall_s"]:.3f} s)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated numbers of trips (default: %(default)s)')
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), 'data'),
+                        help='where the synthetic CSV files are generated and reused')
+    parser.add_argument('--results', default=RESULTS, help='JSON lines file the timings are appended to')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    run = {
+        'run': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+    }
+    previous = read_results(args.results)
+
+    records = []
+    for rows in (int(size) for size in args.sizes.split(',')):
+        records += benchmark_size(rows, args.data_dir, run, args.chunksize)
+
+    with open(args.results, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    compare(records, previous)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+# Cyclistic bike share analysis pipeline.
+#
+# The notebook (CyclisticDataProject.ipynb / .py) explores a single quarter of trips.
+# The modules in this package run the same cleaning and analysis steps over many quarters.
@@ -0,0 +1,3 @@
+from cyclistic.cli import main
+
+main()
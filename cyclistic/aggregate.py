@@ -0,0 +1,234 @@
+# Single-pass aggregation of the user type breakdowns (notebook cells 26-39).
+#
+# The notebook runs a separate groupby over the whole frame for every table. Here the trips
+# are scanned once: every trip gets integer codes for its usertype, day of week, start hour,
+# gender and duration band, and all measures are summed into small cubes with np.bincount.
+# The tables behind the plots are then rolled up from the cubes, which only hold a few
+# thousand rows. The cubes are plain sums and counts, so the cubes of separate chunks or
+# quarters can be merged by adding them.
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.schema import DAYS_ORDER, GENDERS, USERTYPES
+
+
+# Trip durations kept by the notebook's outlier filter (cell 17): 1 minute < tripduration < 1 hour.
+DURATION_RANGE = (60, 3600)
+
+ACTIVITY_KEYS = ['usertype', 'day_of_week', 'start_hour', 'gender', 'in_range']
+ACTIVITY_MEASURES = ['trips', 'duration_count', 'duration_sum', 'birthyear_missing']
+
+
+def group_total(values, by):
+    """Total of `values` within each `by` group, aligned with `values` (a vectorized transform)."""
+    return values.groupby(by, observed=True, sort=False).transform('sum')
+
+
+def share_within(values, by, scale=100):
+    """Each value as a share of its `by` group's total, times `scale` (100 for percentages).
+
+    This replaces groupby(...).apply(lambda x: x / x.sum() * 100), which calls back into
+    Python once per group and returns a result indexed by group that no longer lines up with
+    the table it is assigned to.
+    """
+    return values / group_total(values, by) * scale
+
+
+def category_codes(values, categories):
+    """Return the integer codes of `values` in `categories` (-1 for missing or unknown values)."""
+    if isinstance(values.dtype, pd.CategoricalDtype) and list(values.cat.categories) == list(categories):
+        return values.cat.codes.to_numpy()
+    return pd.Categorical(values, categories=categories).codes
+
+
+def station_counts(usertype, stations, valid):
+    """Count trips per (usertype, station) with a single bincount over combined codes."""
+    stations = pd.Categorical(stations)
+    codes = stations.codes
+    valid = valid & (codes >= 0)
+    n_stations = len(stations.categories)
+
+    key = usertype[valid].astype(np.int64) * n_stations + codes[valid]
+    counts = np.bincount(key, minlength=len(USERTYPES) * n_stations)
+    nonzero = np.flatnonzero(counts)
+
+    index = pd.MultiIndex.from_arrays(
+        [np.asarray(USERTYPES)[nonzero // n_stations], np.asarray(stations.categories)[nonzero % n_stations]],
+        names=['usertype', 'station'],
+    )
+    return pd.Series(counts[nonzero], index=index, name='trips')
+
+
+class TripAggregates:
+    """Cubes of trip counts and sums that all the user type breakdowns are served from.
+
+    activity        -- trips, duration count/sum and missing birthyears per
+                       (usertype, day_of_week, start_hour, gender, in_range)
+    start_stations  -- trips per (usertype, from_station_name)
+    end_stations    -- trips per (usertype, to_station_name)
+    """
+
+    def __init__(self, activity, start_stations, end_stations):
+        self.activity = activity
+        self.start_stations = start_stations
+        self.end_stations = end_stations
+
+    @classmethod
+    def from_trips(cls, df):
+        """Build the cubes from a frame of cleaned trips in one pass."""
+        start_time = df['start_time']
+        usertype = category_codes(df['usertype'], USERTYPES)
+        gender = category_codes(df['gender'], GENDERS)
+        valid = (usertype >= 0) & (gender >= 0) & start_time.notna().to_numpy()
+
+        # Use the derived columns (cyclistic.features) when the frame already has them.
+        if 'day_of_week' in df.columns and 'start_hour' in df.columns:
+            day = np.maximum(df['day_of_week'].cat.codes.to_numpy(dtype=np.int64), 0)
+            hour = df['start_hour'].fillna(0).to_numpy(dtype=np.int64)
+        else:
+            day = start_time.dt.dayofweek.fillna(0).to_numpy(dtype=np.int64)
+            hour = start_time.dt.hour.fillna(0).to_numpy(dtype=np.int64)
+        duration = df['tripduration'].to_numpy(dtype=np.float64)
+        has_duration = ~np.isnan(duration)
+        low, high = DURATION_RANGE
+        in_range = (duration > low) & (duration < high)
+        birthyear_missing = df['birthyear'].isna().to_numpy()
+
+        shape = (len(USERTYPES), len(DAYS_ORDER), 24, len(GENDERS), 2)
+        key = np.ravel_multi_index((usertype[valid], day[valid], hour[valid], gender[valid], in_range[valid]), shape)
+        size = int(np.prod(shape))
+
+        measures = {
+            'trips': np.bincount(key, minlength=size),
+            'duration_count': np.bincount(key, weights=has_duration[valid], minlength=size),
+            'duration_sum': np.bincount(key, weights=np.where(has_duration, duration, 0)[valid], minlength=size),
+            'birthyear_missing': np.bincount(key, weights=birthyear_missing[valid], minlength=size),
+        }
+        nonzero = np.flatnonzero(measures['trips'])
+        u, d, h, g, r = np.unravel_index(nonzero, shape)
+        index = pd.MultiIndex.from_arrays(
+            [np.asarray(USERTYPES)[u], d, h, np.asarray(GENDERS)[g], r.astype(bool)], names=ACTIVITY_KEYS,
+        )
+        activity = pd.DataFrame({name: values[nonzero] for name, values in measures.items()}, index=index)
+
+        return cls(
+            cls.normalize_counts(activity),
+            station_counts(usertype, df['from_station_name'], valid),
+            station_counts(usertype, df['to_station_name'], valid),
+        )
+
+    @staticmethod
+    def normalize_counts(frame):
+        """Store count measures as int64 (adding frames with fill_value turns them into floats)."""
+        frame = frame.sort_index()
+        counts = [c for c in ('trips', 'duration_count', 'birthyear_missing') if c in frame]
+        frame[counts] = frame[counts].astype(np.int64)
+        return frame
+
+    def merge(self, other):
+        """Return the aggregates of the union of the trips behind `self` and `other`."""
+        return TripAggregates(
+            self.normalize_counts(self.activity.add(other.activity, fill_value=0)),
+            self.start_stations.add(other.start_stations, fill_value=0).astype(np.int64).sort_index(),
+            self.end_stations.add(other.end_stations, fill_value=0).astype(np.int64).sort_index(),
+        )
+
+    # Tables used by the notebook, in the same shape as the groupby results they replace.
+
+    def rollup(self, keys, in_range_only=False):
+        activity = self.activity
+        if in_range_only:
+            activity = activity.xs(True, level='in_range', drop_level=False)
+        return activity.groupby(level=keys).sum()
+
+    def trips_by_hour(self):
+        """Cell 19: number of trips per start hour."""
+        return self.rollup('start_hour')['trips'].rename('count')
+
+    def trips_by_usertype(self):
+        """Cell 20: number of trips per usertype."""
+        return self.rollup('usertype')['trips'].rename('count')
+
+    def trips_by_gender(self):
+        """Cell 21: number of trips per gender, in the schema's order of genders."""
+        counts = self.rollup('gender')['trips'].rename('count')
+        return counts.reindex([g for g in GENDERS if g in counts.index])
+
+    def top_start_stations(self, n=10):
+        """Cell 22: the `n` most popular start stations over all usertypes."""
+        return self.start_stations.groupby(level='station').sum().nlargest(n).rename('count')
+
+    def top_end_stations(self, n=10):
+        """Cell 24: the `n` most popular end stations over all usertypes."""
+        return self.end_stations.groupby(level='station').sum().nlargest(n).rename('count')
+
+    def mean_trip_duration(self):
+        """Cell 26: mean trip duration per usertype, over trips within DURATION_RANGE."""
+        cube = self.rollup('usertype', in_range_only=True)
+        return (cube['duration_sum'] / cube['duration_count']).rename('tripduration')
+
+    def mean_tripduration_by_day_usertype(self):
+        """Cell 28: mean trip duration per day of week and usertype."""
+        cube = self.rollup(['day_of_week', 'usertype'])
+        table = (cube['duration_sum'] / cube['duration_count']).rename('tripduration').reset_index()
+        table['day_of_week'] = day_names(table['day_of_week'])
+        return table
+
+    def hourly_counts(self):
+        """Cell 29: trips per usertype and start hour, with each usertype's percentage per hour."""
+        table = self.rollup(['usertype', 'start_hour'])['trips'].rename('counts').reset_index()
+        table['percent'] = share_within(table['counts'], table['usertype'])
+        return table
+
+    def trips_by_day_usertype(self):
+        """Cell 30: trips per day of week and usertype, and their proportion of the day's trips."""
+        table = self.rollup(['day_of_week', 'usertype'])['trips'].rename('trip_count').reset_index()
+        table['total_trip_count'] = group_total(table['trip_count'], table['day_of_week'])
+        table['proportion_of_trips'] = share_within(table['trip_count'], table['day_of_week'], scale=1)
+        table['day_of_week'] = day_names(table['day_of_week'])
+        return table
+
+    def popular_start_stations(self, n=10):
+        """Cell 32: the `n` most popular start stations of each usertype."""
+        return top_stations(self.start_stations, n, 'From station name')
+
+    def popular_end_stations(self, n=10):
+        """Cell 33: the `n` most popular end stations of each usertype."""
+        return top_stations(self.end_stations, n, 'To station name')
+
+    def unknown_birthyear_percentages(self):
+        """Cell 34: percentage of trips without a birthyear per usertype."""
+        cube = self.rollup('usertype')
+        return (cube['birthyear_missing'] / cube['trips'] * 100).rename('birthyear')
+
+    def gender_user_type(self):
+        """Cell 39: percentage of each gender within each usertype."""
+        counts = self.rollup(['usertype', 'gender'])['trips']
+        percent = share_within(counts, counts.index.get_level_values('usertype'))
+        return percent.unstack().fillna(0)
+
+
+def day_names(day_numbers):
+    """Map day numbers (Monday=0) to an ordered categorical of day names."""
+    return pd.Categorical.from_codes(day_numbers, categories=DAYS_ORDER, ordered=True)
+
+
+def top_stations(counts, n, station_column):
+    table = counts.reset_index().sort_values(by='trips', ascending=False, kind='stable').groupby('usertype').head(n)
+    table.columns = ['User type', station_column, 'Trip Count']
+    return table
+
+
+def aggregate_trips(df):
+    """Scan a frame of cleaned trips once and return its TripAggregates."""
+    return TripAggregates.from_trips(df)
+
+
+def aggregate_chunks(chunks):
+    """Aggregate an iterable of cleaned trip chunks (e.g. iter_trip_chunks) into one TripAggregates."""
+    aggregates = None
+    for chunk in chunks:
+        partial = aggregate_trips(chunk)
+        aggregates = partial if aggregates is None else aggregates.merge(partial)
+    return aggregates
@@ -0,0 +1,220 @@
+# Bike-level analytics: utilization, idle gaps and rebalancing of the fleet.
+#
+# The notebook loads 'bikeid' but never looks at it. Here the trips are sorted once by
+# (bikeid, start_time), so the trips of every bike are consecutive and in order, and
+# everything else is a vectorized sweep over neighbouring rows:
+#
+#   idle gap   end_time of a trip -> start_time of the same bike's next trip
+#   teleport   a trip starting at another station than the one the bike's previous trip
+#              ended at: the bike was moved in between (rebalancing, or repair)
+#   overlap    a trip starting before the bike's previous trip ended (a data error)
+#
+# Daily utilization is the share of a day a bike spends riding; trips crossing midnight
+# are split between the days. Per-bike totals are np.add.reduceat over the runs of each
+# bike, so tens of millions of trips are handled without a Python loop over rows or bikes.
+
+import numpy as np
+import pandas as pd
+
+
+SECONDS_PER_DAY = 86400
+
+COLUMNS = ['bikeid', 'start_time', 'end_time', 'from_station_id', 'to_station_id']
+
+
+class BikeTrips:
+    """The trips of every bike, sorted by (bikeid, start_time), as flat NumPy arrays."""
+
+    def __init__(self, bike, start, end, from_station, to_station):
+        order = bike_order(bike, start)
+        self.bike = bike[order]
+        self.start = start[order]
+        self.end = end[order]
+        self.from_station = from_station[order]
+        self.to_station = to_station[order]
+
+        # first row of every bike's run of trips
+        self.first = np.flatnonzero(np.diff(self.bike, prepend=self.bike[:1] - 1))
+        # row i and row i + 1 are consecutive trips of the same bike
+        self.same_bike = self.bike[1:] == self.bike[:-1]
+
+    @classmethod
+    def from_trips(cls, df):
+        """From a frame of cleaned trips; trips without a bike or timestamps are left out."""
+        valid = (df['bikeid'].notna() & df['start_time'].notna() & df['end_time'].notna()).to_numpy()
+        df = df[COLUMNS][valid]
+        return cls(df['bikeid'].to_numpy(dtype=np.int64),
+                   df['start_time'].to_numpy(dtype='datetime64[s]').astype(np.int64),
+                   df['end_time'].to_numpy(dtype='datetime64[s]').astype(np.int64),
+                   df['from_station_id'].to_numpy(dtype=np.int64),
+                   df['to_station_id'].to_numpy(dtype=np.int64))
+
+    @classmethod
+    def from_store(cls, store):
+        """From a cyclistic.columnstore.ColumnStore, reading only the five columns needed."""
+        start = np.asarray(store.column('start_time')).astype('datetime64[s]')
+        end = np.asarray(store.column('end_time')).astype('datetime64[s]')
+        valid = ~(np.isnat(start) | np.isnat(end))
+        return cls(np.asarray(store.column('bikeid'))[valid].astype(np.int64),
+                   start[valid].astype(np.int64), end[valid].astype(np.int64),
+                   np.asarray(store.column('from_station_id'))[valid].astype(np.int64),
+                   np.asarray(store.column('to_station_id'))[valid].astype(np.int64))
+
+    def __len__(self):
+        return len(self.bike)
+
+    @property
+    def bikes(self):
+        return self.bike[self.first]
+
+    def gaps(self):
+        """One row per pair of consecutive trips of a bike: the idle time between them.
+
+        'station' is where the bike was left; 'next_station' where it was taken from next
+        ('teleport' when they differ). 'idle_seconds' is negative for overlapping trips.
+        """
+        pair = np.flatnonzero(self.same_bike)
+        after = pair + 1
+        return pd.DataFrame({
+            'bikeid': self.bike[pair],
+            'idle_start': self.end[pair].astype('datetime64[s]'),
+            'idle_end': self.start[after].astype('datetime64[s]'),
+            'idle_seconds': self.start[after] - self.end[pair],
+            'station': self.to_station[pair],
+            'next_station': self.from_station[after],
+            'teleport': self.to_station[pair] != self.from_station[after],
+        })
+
+    def teleports(self):
+        """The idle gaps in which the bike was moved to another station."""
+        gaps = self.gaps()
+        return gaps[gaps['teleport']].reset_index(drop=True)
+
+    def rebalancing_flows(self, n=None):
+        """Bikes moved between each pair of stations (left at 'station', taken from 'next_station')."""
+        moved = self.teleports()
+        flows = moved.groupby(['station', 'next_station']).size().rename('bikes_moved')
+        flows = flows.sort_values(ascending=False, kind='stable')
+        return flows if n is None else flows.head(n)
+
+    def station_rebalancing(self):
+        """Per station: bikes moved away after being left there, and bikes moved in before a trip."""
+        moved = self.teleports()
+        table = pd.DataFrame({
+            'moved_out': moved['station'].value_counts(),
+            'moved_in': moved['next_station'].value_counts(),
+        }).fillna(0).astype(np.int64)
+        table['net_moved_in'] = table['moved_in'] - table['moved_out']
+        table.index.name = 'station_id'
+        return table.sort_values('net_moved_in', kind='stable')
+
+    def daily_utilization(self):
+        """Ride time per bike and day, with the share of the day spent riding ('utilization')."""
+        ride = np.maximum(self.end - self.start, 0)
+        first_day = self.start // SECONDS_PER_DAY
+        last_day = (self.start + ride - (ride > 0)) // SECONDS_PER_DAY
+
+        # one piece per (trip, day it covers): the part of every trip on its first day, then
+        # the later days of the few trips crossing midnight
+        crossing = np.flatnonzero(last_day > first_day)
+        spans = (last_day - first_day)[crossing]
+        extra = np.repeat(crossing, spans)
+        extra_day = first_day[extra] + 1 + np.arange(len(extra)) - np.repeat(np.cumsum(spans) - spans, spans)
+        day = np.concatenate([first_day, extra_day])
+        end = self.start + ride
+        seconds = np.concatenate([
+            np.minimum(end, (first_day + 1) * SECONDS_PER_DAY) - self.start,
+            np.minimum(end[extra], (extra_day + 1) * SECONDS_PER_DAY) - extra_day * SECONDS_PER_DAY,
+        ])
+        run = np.repeat(np.arange(len(self.first)), np.diff(np.append(self.first, len(self))))
+        run = np.concatenate([run, run[extra]])
+
+        # sum the pieces per (bike, day) cell of a dense bike x day grid, or, when few of its
+        # cells would be used, per distinct cell
+        day0 = day.min() if len(day) else 0
+        n_days = int(day.max() - day0) + 1 if len(day) else 0
+        cell = run * n_days + (day - day0)
+        if len(self.first) * n_days > 8 * len(cell):
+            cells, cell = np.unique(cell, return_inverse=True)
+        else:
+            cells = np.arange(len(self.first) * n_days)
+        pieces = np.bincount(cell, minlength=len(cells))
+        ride_seconds = np.bincount(cell, weights=seconds, minlength=len(cells)).astype(np.int64)
+        trips = np.bincount(cell[:len(self)], minlength=len(cells))
+
+        used = np.flatnonzero(pieces)
+        bike_run, day = np.divmod(cells[used], max(n_days, 1))
+        return pd.DataFrame({
+            'bikeid': self.bikes[bike_run],
+            'date': (day + day0).astype('datetime64[D]'),
+            'trips': trips[used],
+            'ride_seconds': ride_seconds[used],
+            'utilization': ride_seconds[used] / SECONDS_PER_DAY,
+        })
+
+    def bike_summary(self):
+        """Per bike: trips, ride time, active days, mean utilization of those days, idle time and teleports."""
+        if not len(self):
+            return pd.DataFrame(columns=['trips', 'first_trip', 'last_trip', 'ride_hours', 'active_days',
+                                         'mean_utilization', 'median_idle_hours', 'teleports'])
+        ride = np.maximum(self.end - self.start, 0)
+        runs = np.diff(np.append(self.first, len(self)))
+        last = self.first + runs - 1
+
+        # gap i lies between trips i and i + 1, and belongs to the bike of trip i
+        run_of_gap = np.repeat(np.arange(len(runs)), runs)[:-1][self.same_bike]
+        idle = (self.start[1:] - self.end[:-1])[self.same_bike]
+        teleport = self.same_bike & (self.to_station[:-1] != self.from_station[1:])
+        daily = self.daily_utilization()
+        day_runs = np.flatnonzero(np.diff(daily['bikeid'].to_numpy(), prepend=-1))
+
+        return pd.DataFrame({
+            'trips': runs,
+            'first_trip': self.start[self.first].astype('datetime64[s]'),
+            'last_trip': self.end[last].astype('datetime64[s]'),
+            'ride_hours': np.add.reduceat(ride, self.first) / 3600,
+            'active_days': np.diff(np.append(day_runs, len(daily))),
+            'mean_utilization': np.add.reduceat(daily['utilization'].to_numpy(), day_runs)
+            / np.diff(np.append(day_runs, len(daily))),
+            'median_idle_hours': median_by_run(idle, run_of_gap, len(runs)) / 3600,
+            'teleports': np.add.reduceat(np.append(teleport, False), self.first),
+        }, index=pd.Index(self.bikes, name='bikeid'))
+
+
+def bike_order(bike, time):
+    """Permutation sorting rows by (bike, time), like np.lexsort((time, bike)) but faster.
+
+    Two stable sorts: by time (skipped when the rows are already in time order, as in the
+    Divvy files), then by bike, which NumPy radix-sorts once the ids fit in 16 bits. Rows
+    already sorted by (bike, time) are not sorted at all.
+    """
+    same = bike[1:] == bike[:-1]
+    if np.all((bike[1:] > bike[:-1]) | (same & (time[1:] >= time[:-1]))):
+        return np.arange(len(bike))
+    by_time = None if np.all(time[1:] >= time[:-1]) else np.argsort(time, kind='stable')
+    bike = bike if by_time is None else bike[by_time]
+    if len(bike) and bike.min() >= 0 and bike.max() < 1 << 16:
+        bike = bike.astype(np.uint16)
+    by_bike = np.argsort(bike, kind='stable')
+    return by_bike if by_time is None else by_time[by_bike]
+
+
+def median_by_run(values, run, n_runs):
+    """Median of the values of every run (run numbers ascending), NaN for runs without values.
+
+    The values are sorted by (run, value) once; each run's median is then read at the middle
+    of its slice.
+    """
+    values = values[bike_order(run, values)]
+    counts = np.bincount(run, minlength=n_runs)
+    offsets = np.cumsum(counts) - counts
+    medians = np.full(n_runs, np.nan)
+    has = counts > 0
+    low = offsets[has] + (counts[has] - 1) // 2
+    high = offsets[has] + counts[has] // 2
+    medians[has] = (values[low] + values[high]) / 2
+    return medians
+
+
+def bike_trips(df):
+    return BikeTrips.from_trips(df)
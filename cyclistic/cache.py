@@ -0,0 +1,273 @@
+# Columnar cache of the cleaned trips.
+#
+# Cleaned trips are stored as Parquet files partitioned by the year and quarter of
+# 'start_time' (<cache_dir>/year=2019/quarter=1/part-<source>.parquet). A manifest records
+# the size, mtime and SHA-256 of every source CSV, so a re-run only cleans files that changed
+# and the analyses can read just the columns and partitions they use.
+#
+# The derived columns of cyclistic.features are stored in the same files. The manifest also
+# records how they were computed (feature_key), so they are recomputed when the source
+# changes or when their definition or reference date does.
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from cyclistic.features import REFERENCE_DATE, add_features, feature_key
+from cyclistic.loader import CHUNK_SIZE, iter_trip_chunks
+from cyclistic.schema import apply_trip_schema
+
+
+CACHE_DIR = 'cleaned_trips'
+MANIFEST_NAME = 'manifest.json'
+
+# Low-cardinality text columns stored dictionary-encoded and loaded back as categoricals.
+CATEGORICAL_COLUMNS = ['from_station_name', 'to_station_name', 'usertype', 'gender', 'day_of_week']
+
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('quarter', pa.int8())]), flavor='hive')
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Return the hex SHA-256 digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def source_name(path):
+    """Name of a source file in the manifest and its partition files: its base name and a hash
+    of its absolute path, so same-named files in different directories do not collide."""
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    return f'{base_name(path)}-{digest}'
+
+
+def base_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def renamed_sources(path, manifest):
+    """Other names under which the manifest records `path` (e.g. its base name alone, as the
+    manifest was keyed before source_name() included the directory)."""
+    source, name = os.path.abspath(path), source_name(path)
+    return [other for other, entry in manifest.items() if entry.get('source') == source and other != name]
+
+
+def source_entry(path):
+    """Return the manifest fields that identify the current version of a source file."""
+    stat = os.stat(path)
+    return {
+        'source': os.path.abspath(path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': file_sha256(path),
+    }
+
+
+def is_cached(path, cache_dir=CACHE_DIR, manifest=None):
+    """Return True if the cache holds the cleaned trips of the current version of `path`.
+
+    The mtime and size are checked first; the file is only hashed when they changed, so a
+    touched but otherwise identical file does not trigger a rebuild.
+    """
+    if manifest is None:
+        manifest = read_manifest(cache_dir)
+    entry = manifest.get(source_name(path))
+    if entry is None:
+        return False
+
+    stat = os.stat(path)
+    if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return True
+    if entry['size'] != stat.st_size or entry['sha256'] != file_sha256(path):
+        return False
+
+    # Same content with a new mtime: remember it so the next check is cheap again.
+    entry['mtime_ns'] = stat.st_mtime_ns
+    write_manifest(manifest, cache_dir)
+    return True
+
+
+def to_cache_table(df):
+    """Convert a cleaned frame to an Arrow table with dictionary-encoded text columns."""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def remove_partition_files(name, cache_dir=CACHE_DIR):
+    """Delete every cached partition file written from the source called `name`."""
+    for part in glob.glob(os.path.join(cache_dir, 'year=*', 'quarter=*', f'part-{name}.parquet')):
+        os.remove(part)
+
+
+def remove_source(name, cache_dir=CACHE_DIR, manifest=None):
+    """Remove the source called `name` from the manifest and delete its partition files."""
+    if manifest is None:
+        manifest = read_manifest(cache_dir)
+    manifest.pop(name, None)
+    write_manifest(manifest, cache_dir)
+    remove_partition_files(name, cache_dir)
+
+
+def partition_path(partition, name, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, partition, f'part-{name}.parquet')
+
+
+def write_partitions(chunks, name, cache_dir=CACHE_DIR, reference_date=REFERENCE_DATE):
+    """Write cleaned chunks from the source called `name` into their year/quarter partitions.
+
+    The derived columns are added to every chunk on the way. Replaces any partition files
+    previously written for `name`, but does not touch the manifest. Returns the sorted list
+    of partitions written to.
+    """
+    remove_partition_files(name, cache_dir)
+
+    writers = {}
+    try:
+        for chunk in chunks:
+            chunk = add_features(chunk.copy(deep=False), reference_date)
+            start_time = chunk['start_time']
+            keys = start_time.dt.year * 10 + start_time.dt.quarter
+            for key, part in chunk.groupby(keys, sort=True):
+                partition = f'year={key // 10}/quarter={key % 10}'
+                table = to_cache_table(part)
+                if partition not in writers:
+                    os.makedirs(os.path.join(cache_dir, partition), exist_ok=True)
+                    writers[partition] = pq.ParquetWriter(partition_path(partition, name, cache_dir), table.schema)
+                writers[partition].write_table(table.cast(writers[partition].schema))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return sorted(writers)
+
+
+def store_cleaned_trips(chunks, path, cache_dir=CACHE_DIR, reference_date=REFERENCE_DATE):
+    """Write cleaned trips read from `path` into the cache and record `path` in the manifest.
+
+    `chunks` is a cleaned frame or an iterable of cleaned frames (e.g. from iter_trip_chunks).
+    A frame passed in gets the derived columns too.
+    """
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+
+    name = source_name(path)
+    manifest = read_manifest(cache_dir)
+    for other in renamed_sources(path, manifest) + [name]:
+        remove_source(other, cache_dir, manifest)
+    partitions = write_partitions(chunks, name, cache_dir, reference_date)
+
+    manifest = read_manifest(cache_dir)
+    manifest[name] = dict(source_entry(path), partitions=partitions, features=feature_key(reference_date))
+    write_manifest(manifest, cache_dir)
+
+
+def refresh_features(cache_dir=CACHE_DIR, reference_date=REFERENCE_DATE):
+    """Recompute the derived columns of every cached source whose feature_key is out of date.
+
+    Only the cached Parquet files are read and rewritten; the source CSVs are not cleaned
+    again. Returns the names of the sources that were updated.
+    """
+    manifest = read_manifest(cache_dir)
+    key = feature_key(reference_date)
+    stale = [name for name, entry in manifest.items() if entry.get('features') != key]
+    for name in stale:
+        for partition in manifest[name]['partitions']:
+            part_path = partition_path(partition, name, cache_dir)
+            df = apply_trip_schema(pq.read_table(part_path).to_pandas())
+            pq.write_table(to_cache_table(add_features(df, reference_date)), part_path + '.tmp')
+            os.replace(part_path + '.tmp', part_path)
+        manifest[name]['features'] = key
+    if stale:
+        write_manifest(manifest, cache_dir)
+    return stale
+
+
+def build_cache(paths, cache_dir=CACHE_DIR, chunksize=CHUNK_SIZE, reference_date=REFERENCE_DATE):
+    """Clean and cache every source file that is missing from the cache or has changed.
+
+    Cached files whose derived columns are out of date only get those columns recomputed.
+    Returns the list of files that were (re)built.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    built = []
+    for path in paths:
+        if is_cached(path, cache_dir):
+            continue
+        store_cleaned_trips(iter_trip_chunks(path, chunksize=chunksize), path, cache_dir, reference_date)
+        built.append(path)
+    refresh_features(cache_dir, reference_date)
+    return built
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+
+
+def cache_dataset(cache_dir=CACHE_DIR):
+    """Open the cache as a pyarrow dataset with 'year' and 'quarter' partition fields."""
+    return ds.dataset(cache_dir, format='parquet', partitioning=PARTITIONING, exclude_invalid_files=True)
+
+
+def partition_filter(years=None, quarters=None):
+    """Build a dataset filter selecting the given years and/or quarters (None selects all)."""
+    expr = None
+    for field, values in (('year', years), ('quarter', quarters)):
+        if values is None:
+            continue
+        if isinstance(values, int):
+            values = [values]
+        cond = ds.field(field).isin(list(values))
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def load_cached_trips(cache_dir=CACHE_DIR, columns=None, years=None, quarters=None, sources=None):
+    """Load cleaned trips from the cache.
+
+    Only the requested `columns` are read, and only the partitions of the requested
+    `years`/`quarters` and, with `sources`, only the trips cleaned from those source files.
+    Columns are returned in the compact TRIP_SCHEMA dtypes.
+    """
+    dataset = cache_dataset(cache_dir)
+    if sources is not None:
+        if isinstance(sources, (str, os.PathLike)):
+            sources = [sources]
+        manifest = read_manifest(cache_dir)
+        files = [partition_path(partition, source_name(path), cache_dir)
+                 for path in sources for partition in manifest.get(source_name(path), {}).get('partitions', [])]
+        dataset = ds.dataset(files, schema=dataset.schema, format='parquet', partitioning=PARTITIONING,
+                             partition_base_dir=cache_dir)
+    table = dataset.to_table(columns=columns, filter=partition_filter(years, quarters))
+    if columns is None:
+        table = table.drop_columns([c for c in ('year', 'quarter') if c in table.column_names])
+    return apply_trip_schema(table.to_pandas())
@@ -0,0 +1,155 @@
+# Command line entry point: python -m cyclistic <command> ...
+#
+#   ingest DATA_DIR      clean the quarterly CSVs into the Parquet cache, the column store
+#                        and the aggregate store (only new or changed files)
+#   aggregate [DATA_DIR] print the tables of the aggregate store (ingesting DATA_DIR first)
+#   report DATA_DIR      write the HTML report with every figure
+#   query                answer one query from the column store, or --serve them over HTTP
+#
+# Only argparse is imported up front; every command imports the modules it needs when it
+# runs, so `--help` and the non-plotting commands never load matplotlib or seaborn, and
+# `--help` does not even load pandas. benchmarks/bench_startup.py checks the startup time
+# of the commands against STARTUP_BUDGET.
+
+import argparse
+import json
+import sys
+
+
+# Seconds a non-plotting command may take before it starts its own work (interpreter start
+# and imports), as measured by benchmarks/bench_startup.py.
+STARTUP_BUDGET = 1.5
+
+PLOTTING_MODULES = ['matplotlib', 'seaborn']
+
+
+def quarter_files(data_dir):
+    from cyclistic.loader import find_quarter_files
+
+    paths = find_quarter_files(data_dir)
+    if not paths:
+        raise SystemExit(f'No Divvy_Trips_<year>_Q<n>.csv files in {data_dir}')
+    return paths
+
+
+def ingest_command(args):
+    paths = quarter_files(args.data_dir)
+    if 'cache' in args.targets:
+        from cyclistic.cache import CACHE_DIR
+        from cyclistic.parallel import parallel_build_cache
+
+        built = parallel_build_cache(paths, args.cache_dir or CACHE_DIR, args.workers, args.chunksize)
+        print(f'cache: {len(built)} of {len(paths)} files cleaned')
+    if 'columns' in args.targets:
+        from cyclistic.columnstore import STORE_DIR, ingest_columns
+
+        added = ingest_columns(paths, args.columns_dir or STORE_DIR, args.chunksize)
+        print(f'columns: {len(added)} of {len(paths)} files appended')
+    if 'aggregates' in args.targets:
+        from cyclistic.store import STORE_DIR, ingest
+
+        aggregated = ingest(paths, args.aggregates_dir or STORE_DIR, args.chunksize)
+        print(f'aggregates: {len(aggregated)} of {len(paths)} files aggregated')
+
+
+def aggregate_command(args):
+    from cyclistic.store import STORE_DIR, TABLES, ingest, load_store
+
+    store_dir = args.aggregates_dir or STORE_DIR
+    if args.data_dir:
+        ingest(quarter_files(args.data_dir), store_dir, args.chunksize)
+    aggregates = load_store(store_dir)
+    if aggregates is None:
+        raise SystemExit(f'The aggregate store {store_dir} is empty; run `ingest` first')
+
+    for name in args.tables or TABLES:
+        table = getattr(aggregates, name)()
+        if args.csv:
+            table.to_csv(sys.stdout)
+        else:
+            print(f'{name}\n{table}\n')
+
+
+def report_command(args):
+    from cyclistic.report import FORMATS, REPORT_DIR, build_report
+
+    path, _ = build_report(quarter_files(args.data_dir), args.output or REPORT_DIR,
+                           tuple(args.formats or FORMATS), args.workers, embed=not args.link)
+    print(f'Report written to {path}')
+
+
+def query_command(args):
+    from cyclistic.columnstore import STORE_DIR
+
+    store_dir = args.columns_dir or STORE_DIR
+    if args.serve:
+        from cyclistic.server import CACHE_BYTES, HOST, PORT, serve
+
+        serve(store_dir, args.host or HOST, args.port or PORT, args.cache_bytes or CACHE_BYTES)
+        return
+
+    from cyclistic.columnstore import ColumnStore
+    from cyclistic.server import QueryError, run_query
+
+    params = {name: getattr(args, name) for name in ('metric', 'usertype', 'station', 'start', 'end')
+              if getattr(args, name)}
+    try:
+        print(json.dumps(run_query(ColumnStore(store_dir), params), indent=2))
+    except QueryError as e:
+        raise SystemExit(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cyclistic', description='Cyclistic bike share analysis.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='clean and store the quarterly CSV files')
+    ingest.add_argument('data_dir', help='directory of Divvy_Trips_<year>_Q<n>.csv files')
+    ingest.add_argument('--targets', nargs='+', choices=['cache', 'columns', 'aggregates'],
+                        default=['cache', 'columns', 'aggregates'], help='stores to update (default: all)')
+    ingest.add_argument('--workers', type=int, help='worker processes for the cache (default: one per CPU)')
+
+    aggregate = commands.add_parser('aggregate', help='print the tables of the aggregate store')
+    aggregate.add_argument('data_dir', nargs='?', help='ingest new or changed quarterly files from here first')
+    aggregate.add_argument('--tables', nargs='+', help='tables to print (default: all)')
+    aggregate.add_argument('--csv', action='store_true', help='print the tables as CSV')
+
+    report = commands.add_parser('report', help='write the HTML report (imports matplotlib)')
+    report.add_argument('data_dir', help='directory of Divvy_Trips_<year>_Q<n>.csv files')
+    report.add_argument('--output', help='report directory (default: report)')
+    report.add_argument('--formats', nargs='+', help='image formats (default: png svg)')
+    report.add_argument('--workers', type=int, help='worker processes for the figures')
+    report.add_argument('--link', action='store_true', help='link the images instead of embedding them')
+
+    query = commands.add_parser('query', help='query the column store, or serve queries over HTTP')
+    query.add_argument('--metric', help='trips, hourly_profile, day_of_week, daily_trips, mean_duration, '
+                                        'top_end_stations (default: trips)')
+    query.add_argument('--usertype', help='Customer or Subscriber')
+    query.add_argument('--station', help='start station id, or part of its name')
+    query.add_argument('--start', help='first date (YYYY-MM-DD)')
+    query.add_argument('--end', help='last date (YYYY-MM-DD)')
+    query.add_argument('--serve', action='store_true', help='run the HTTP query service instead')
+    query.add_argument('--host')
+    query.add_argument('--port', type=int)
+    query.add_argument('--cache-bytes', type=int, help='size of the result cache')
+
+    for command in (ingest, aggregate):
+        command.add_argument('--chunksize', type=int, help='rows read per chunk')
+        command.add_argument('--aggregates-dir', help='aggregate store (default: trip_aggregates)')
+    for command in (ingest, query):
+        command.add_argument('--columns-dir', help='column store (default: trip_columns)')
+    ingest.add_argument('--cache-dir', help='Parquet cache (default: cleaned_trips)')
+
+    ingest.set_defaults(func=ingest_command)
+    aggregate.set_defaults(func=aggregate_command)
+    report.set_defaults(func=report_command)
+    query.set_defaults(func=query_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'chunksize', 0) is None:
+        from cyclistic.loader import CHUNK_SIZE
+        args.chunksize = CHUNK_SIZE
+    args.func(args)
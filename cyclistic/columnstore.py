@@ -0,0 +1,318 @@
+# On-disk column store of the cleaned trips, read through memory maps.
+#
+# Every column is one flat binary file of fixed-width values (<store_dir>/<column>.bin),
+# opened with np.memmap, so a query only touches the pages of the columns and rows it reads
+# and every process that opens the store shares the same OS page cache. Text columns are
+# dictionary-encoded: the file holds integer codes, and the dictionaries (station names,
+# user types, genders, days) are kept in columns.json with the dtypes and the row count.
+# Lookups by station id, user type and start date use the sorted indexes of
+# cyclistic.indexes, which are updated whenever quarters are ingested.
+#
+#   trip_columns/
+#       columns.json
+#       trip_id.bin, start_time.bin, ..., from_station_name.bin (codes), ...
+#       indexes/
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.cache import base_name, file_sha256, source_name
+from cyclistic.features import REFERENCE_DATE, add_features
+from cyclistic.indexes import TripIndexes
+from cyclistic.loader import CHUNK_SIZE, iter_trip_chunks
+from cyclistic.schema import DAYS_ORDER, FEATURE_SCHEMA, GENDERS, TRIP_SCHEMA, USERTYPES
+
+
+STORE_DIR = 'trip_columns'
+META_NAME = 'columns.json'
+
+# On-disk dtype of every column, in the order of the cleaned trips frame. Text columns hold
+# dictionary codes (-1 for missing); nullable integers store missing values as the smallest
+# value of their dtype, timestamps as NaT and floats as NaN.
+COLUMN_DTYPES = {
+    'trip_id': 'int32',
+    'start_time': 'datetime64[ns]',
+    'end_time': 'datetime64[ns]',
+    'bikeid': 'int16',
+    'tripduration': 'float64',
+    'from_station_id': 'int16',
+    'from_station_name': 'int16',
+    'to_station_id': 'int16',
+    'to_station_name': 'int16',
+    'usertype': 'int8',
+    'gender': 'int8',
+    'birthyear': 'int16',
+    'start_hour': 'int8',
+    'day_of_week': 'int8',
+    'age': 'int16',
+}
+
+# Dictionary-encoded columns and their fixed dictionaries (None for the station names, whose
+# dictionaries grow as new stations appear).
+ENCODED_COLUMNS = {
+    'from_station_name': None,
+    'to_station_name': None,
+    'usertype': USERTYPES,
+    'gender': GENDERS,
+    'day_of_week': DAYS_ORDER,
+}
+
+NULLABLE_COLUMNS = ['birthyear', 'start_hour', 'age']
+
+
+def missing_value(column):
+    if column in ENCODED_COLUMNS:
+        return -1
+    if column in NULLABLE_COLUMNS:
+        return int(np.iinfo(COLUMN_DTYPES[column]).min)
+    return None
+
+
+def encode(values, dictionary):
+    """Codes of `values` in `dictionary`, adding unseen values to the end of it."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # encode the categories once and map the categorical's codes through them
+        category_codes = np.append(encode(values.cat.categories.to_series(), dictionary), -1)
+        return category_codes[values.cat.codes.to_numpy()]
+    values = values.astype(object)
+    known = pd.Index(dictionary)
+    new = pd.Index(values.dropna().unique()).difference(known)
+    dictionary.extend(new.sort_values())
+    return pd.Index(dictionary).get_indexer(values)
+
+
+def decode(column, codes, dictionary):
+    schema = dict(TRIP_SCHEMA, **FEATURE_SCHEMA)
+    dtype = schema[column] if ENCODED_COLUMNS[column] is not None else pd.CategoricalDtype(dictionary)
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+
+class ColumnStore:
+    """A directory of memory-mapped trip columns.
+
+    Open an existing store with ColumnStore(store_dir); build one from quarterly files with
+    build_column_store() or ingest_columns(), or add cleaned trips with append().
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        path = os.path.join(store_dir, META_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {
+                'rows': 0,
+                'dtypes': dict(COLUMN_DTYPES),
+                'dictionaries': {col: list(values or []) for col, values in ENCODED_COLUMNS.items()},
+                'sources': {},
+            }
+        self._maps = {}
+        self._indexes = None
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def columns(self):
+        return list(self.meta['dtypes'])
+
+    def dictionary(self, column):
+        return self.meta['dictionaries'][column]
+
+    def path(self, column):
+        return os.path.join(self.store_dir, f'{column}.bin')
+
+    def column(self, column):
+        """The raw values (or codes) of a column as a read-only memory map."""
+        rows = len(self)
+        if column not in self._maps or len(self._maps[column]) != rows:
+            dtype = np.dtype(self.meta['dtypes'][column])
+            if rows == 0:
+                self._maps[column] = np.empty(0, dtype=dtype)
+            else:
+                self._maps[column] = np.memmap(self.path(column), dtype=dtype, mode='r', shape=(rows,))
+        return self._maps[column]
+
+    @property
+    def indexes(self):
+        if self._indexes is None:
+            self._indexes = TripIndexes(self)
+        return self._indexes
+
+    def codes(self, column, values):
+        """Codes of the given values of an encoded column (values not in the store are dropped)."""
+        if isinstance(values, str) or not hasattr(values, '__iter__'):
+            values = [values]
+        codes = pd.Index(self.dictionary(column)).get_indexer(list(values))
+        return codes[codes >= 0]
+
+    def keys(self, column, rows=None):
+        """The stored values of `column`, or of the derived 'start_date' key, for all or some rows."""
+        data = self.column('start_time' if column == 'start_date' else column)
+        data = data if rows is None else data[rows]
+        return data.astype('datetime64[D]') if column == 'start_date' else data
+
+    def key_values(self, column, values):
+        """Convert the values a query asks for into the stored keys of `column`."""
+        if column in ENCODED_COLUMNS:
+            return self.codes(column, values)
+        if isinstance(values, str) or not hasattr(values, '__iter__'):
+            values = [values]
+        if column == 'start_date':
+            return np.asarray(values, dtype='datetime64[D]')
+        return np.asarray(values, dtype=self.meta['dtypes'][column])
+
+    def matches(self, column, values, rows=None):
+        """Boolean mask of the rows (all, or only `rows`) whose `column` is one of `values`."""
+        data = self.keys(column, rows)
+        values = self.key_values(column, values)
+        return data == values[0] if len(values) == 1 else np.isin(data, values)
+
+    def rows(self, use_indexes=True, **conditions):
+        """Indices of the rows where every column equals the given value (or one of a list of values).
+
+        Besides the stored columns, 'start_date' selects trips by the date of start_time.
+        When some conditions are on indexed columns, the rows of the most selective one are
+        looked up in its index; otherwise the first condition scans its column. Every other
+        condition is then only evaluated on the rows still selected, so it reads just the
+        pages holding them.
+        """
+        rows = None
+        indexed = [col for col in conditions if use_indexes and col in self.indexes]
+        if indexed:
+            column = min(indexed, key=lambda col: self.indexes.count(col, conditions[col]))
+            rows = self.indexes.lookup(column, conditions[column])
+            conditions = {col: values for col, values in conditions.items() if col != column}
+        for column, values in conditions.items():
+            mask = self.matches(column, values, rows)
+            rows = np.flatnonzero(mask) if rows is None else rows[mask]
+        return np.arange(len(self)) if rows is None else rows
+
+    def take(self, rows, columns=None):
+        """A DataFrame of the given rows, in the TRIP_SCHEMA and FEATURE_SCHEMA dtypes."""
+        columns = columns or self.columns
+        data = {}
+        for column in columns:
+            values = np.asarray(self.column(column)[rows])
+            if column in ENCODED_COLUMNS:
+                data[column] = decode(column, values, self.dictionary(column))
+            elif column in NULLABLE_COLUMNS:
+                values = pd.array(values, dtype=dict(TRIP_SCHEMA, **FEATURE_SCHEMA)[column])
+                values[values == missing_value(column)] = pd.NA
+                data[column] = values
+            else:
+                data[column] = values
+        return pd.DataFrame(data, columns=columns)
+
+    def select(self, columns=None, use_indexes=True, **conditions):
+        """Trips matching `conditions` (see rows()), e.g.
+        store.select(from_station_name='Streeter Dr & Grand Ave', usertype='Customer', day_of_week='Saturday').
+        """
+        return self.take(self.rows(use_indexes, **conditions), columns)
+
+    def count(self, use_indexes=True, **conditions):
+        return len(self.rows(use_indexes, **conditions))
+
+    def append(self, chunk, reference_date=REFERENCE_DATE):
+        """Append a cleaned trips chunk (the derived columns are added to it if missing).
+
+        Every column file is first cut back to the row count in columns.json, dropping the
+        rows an interrupted append wrote to some files before its row count was saved.
+        """
+        if any(col not in chunk.columns for col in FEATURE_SCHEMA):
+            chunk = add_features(chunk.copy(deep=False), reference_date)
+        os.makedirs(self.store_dir, exist_ok=True)
+        for column, dtype in self.meta['dtypes'].items():
+            series = chunk[column]
+            if column in ENCODED_COLUMNS:
+                values = encode(series, self.meta['dictionaries'][column]).astype(dtype)
+            elif column in NULLABLE_COLUMNS:
+                values = series.astype('float64').fillna(missing_value(column)).to_numpy(dtype=dtype)
+            else:
+                values = series.to_numpy(dtype=dtype)
+            with open(self.path(column), 'ab') as f:
+                f.truncate(self.meta['rows'] * values.dtype.itemsize)
+                f.write(np.ascontiguousarray(values).tobytes())
+        self.meta['rows'] += len(chunk)
+        self.write_meta()
+        self._indexes = None
+        return self
+
+    def rollback(self):
+        """Drop the rows of a file whose ingestion did not finish (see ingest_columns)."""
+        partial = self.meta.pop('ingesting', None)
+        if partial is not None:
+            self.meta['rows'] = partial['rows']
+            self.write_meta()
+            self._indexes = None
+        return self
+
+    def write_meta(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = os.path.join(self.store_dir, META_NAME)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(path + '.tmp', path)
+
+
+def build_column_store(paths, store_dir=STORE_DIR, chunksize=CHUNK_SIZE, reference_date=REFERENCE_DATE):
+    """Build a new, indexed column store from quarterly files, replacing any existing one.
+
+    The files are recorded in the store's sources like ingest_columns does, so a later
+    ingest_columns over the same files appends only the new ones.
+    """
+    clear_column_store(store_dir)
+    ingest_columns(paths, store_dir, chunksize, reference_date)
+    return ColumnStore(store_dir)
+
+
+def ingest_columns(paths, store_dir=STORE_DIR, chunksize=CHUNK_SIZE, reference_date=REFERENCE_DATE):
+    """Append the trips of every quarterly file not yet in the store, then update the indexes.
+
+    The store is append-only: a file that changed since it was ingested raises ValueError
+    (rebuild the store with build_column_store). A file is recorded in the store's sources
+    together with its last rows; if ingestion stops partway through a file, its rows are
+    rolled back, then or on the next run. Returns the files that were appended.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    store = ColumnStore(store_dir).rollback()
+    sources = store.meta.setdefault('sources', {})
+    added = []
+    for path in paths:
+        name, digest = source_name(path), file_sha256(path)
+        if name not in sources and sources.get(base_name(path)) == digest:
+            # recorded under its base name alone, before source names included the directory
+            sources[name] = sources.pop(base_name(path))
+        if name in sources:
+            if sources[name] != digest:
+                raise ValueError(f'{path} changed since it was added to {store_dir}; '
+                                 'rebuild the column store from all the files with build_column_store')
+            continue
+        # mark the file as in progress, so that the rows of a run stopped partway through it
+        # are dropped (not appended a second time) when it is ingested again
+        store.meta['ingesting'] = {'source': name, 'rows': len(store)}
+        store.write_meta()
+        try:
+            for chunk in iter_trip_chunks(path, chunksize=chunksize):
+                store.append(chunk, reference_date)
+        except BaseException:
+            store.rollback()
+            raise
+        del store.meta['ingesting']
+        sources[name] = digest
+        store.write_meta()
+        added.append(path)
+    store.indexes.update()
+    return added
+
+
+def clear_column_store(store_dir=STORE_DIR):
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
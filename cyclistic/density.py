@@ -0,0 +1,148 @@
+# Binned densities for the trip duration and age plots (cells 16, 18, 27 and 38).
+#
+# sns.histplot(..., kde=True) evaluates the KDE over every trip. Instead, the values are
+# counted per usertype in one streaming pass at a fixed resolution (1 second for
+# 'tripduration', 1 year for 'age'). Histograms with any bin layout and the smoothed
+# density are then derived from those counts, whose size depends on the number of distinct
+# values and not on the number of trips.
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.features import REFERENCE_DATE, ages
+
+
+# Points at which the density curve is evaluated (seaborn's default gridsize).
+GRIDSIZE = 200
+
+
+class ValueHistogram:
+    """Counts of values rounded to `resolution`, per group (e.g. usertype)."""
+
+    def __init__(self, resolution=1, counts=None):
+        self.resolution = resolution
+        if counts is None:
+            counts = pd.Series([], dtype=np.int64, index=pd.MultiIndex.from_arrays([[], []], names=['group', 'value']))
+        self.counts = counts
+
+    @classmethod
+    def from_values(cls, values, groups, resolution=1):
+        return cls(resolution).update(values, groups)
+
+    def update(self, values, groups):
+        """Add a batch of values with the group of each value; missing values are skipped."""
+        values = pd.Series(np.asarray(values, dtype=np.float64))
+        groups = pd.Series(np.asarray(groups, dtype=object))
+        keep = values.notna().to_numpy() & groups.notna().to_numpy()
+        rounded = (values[keep] / self.resolution).round() * self.resolution
+        batch = rounded.groupby([groups[keep].to_numpy(), rounded.to_numpy()]).size()
+        batch.index.names = ['group', 'value']
+        self.counts = self.counts.add(batch, fill_value=0).astype(np.int64)
+        return self
+
+    def merge(self, other):
+        return ValueHistogram(self.resolution, self.counts.add(other.counts, fill_value=0).astype(np.int64))
+
+    def between(self, left=-np.inf, right=np.inf, inclusive='both'):
+        """Return the histogram of the values within [left, right], like Series.between."""
+        values = self.counts.index.get_level_values('value')
+        lower = values >= left if inclusive in ('both', 'left') else values > left
+        upper = values <= right if inclusive in ('both', 'right') else values < right
+        return ValueHistogram(self.resolution, self.counts[lower & upper])
+
+    @property
+    def groups(self):
+        return sorted(self.counts.index.unique('group'))
+
+    def points(self, group=None):
+        """Return the distinct values and their counts, for one group or all of them."""
+        counts = self.counts if group is None else self.counts.xs(group, level='group')
+        if group is None:
+            counts = counts.groupby(level='value').sum()
+        return counts.index.to_numpy(dtype=np.float64), counts.to_numpy(dtype=np.float64)
+
+    def bin_edges(self, bins):
+        """Edges of `bins` equal-width bins over the whole value range (as np.histogram_bin_edges)."""
+        values, _ = self.points()
+        return np.histogram_bin_edges(values, bins=bins)
+
+    def histogram(self, bins, group=None, stat='count'):
+        """Return (heights, edges); stat is 'count' or 'density'."""
+        edges = self.bin_edges(bins) if np.ndim(bins) == 0 else np.asarray(bins)
+        values, weights = self.points(group)
+        heights, edges = np.histogram(values, bins=edges, weights=weights, density=stat == 'density')
+        return heights, edges
+
+    def kde(self, group=None, gridsize=GRIDSIZE):
+        """Gaussian KDE (Scott's rule, as seaborn) computed from the binned counts.
+
+        Each distinct value is a kernel weighted by its count; the bandwidth uses the number
+        of trips, so the curve matches the KDE of the raw values up to the binning resolution.
+        Returns (grid, density) over the value range, with the density integrating to 1.
+        """
+        values, weights = self.points(group)
+        n = weights.sum()
+        grid = np.linspace(values.min(), values.max(), gridsize)
+
+        mean = np.average(values, weights=weights)
+        std = np.sqrt(np.average((values - mean) ** 2, weights=weights) * n / max(n - 1, 1))
+        bandwidth = std * n ** (-1 / 5)
+        if bandwidth == 0:
+            return grid, np.zeros(gridsize)
+
+        density = np.zeros(gridsize)
+        # Evaluate in blocks of values to bound the size of the (grid x values) matrix.
+        block = max(1, 2**22 // gridsize)
+        for start in range(0, len(values), block):
+            z = (grid[:, None] - values[None, start:start + block]) / bandwidth
+            density += np.exp(-0.5 * z**2) @ weights[start:start + block]
+        density /= n * bandwidth * np.sqrt(2 * np.pi)
+        return grid, density
+
+    def to_frame(self):
+        return self.counts.rename('count').reset_index()
+
+
+def build_histograms(chunks, reference_date=REFERENCE_DATE):
+    """Count 'tripduration' and 'age' per usertype over an iterable of cleaned trip chunks.
+
+    'age' is counted from `reference_date`, as in features.add_features (cell 35).
+    """
+    durations, age_counts = ValueHistogram(), ValueHistogram()
+    for chunk in chunks:
+        durations.update(chunk['tripduration'], chunk['usertype'])
+        age_counts.update(ages(chunk['birthyear'], reference_date), chunk['usertype'])
+    return {'tripduration': durations, 'age': age_counts}
+
+
+def histplot(hist, bins, hue=False, stat='count', kde=True, ax=None):
+    """Draw a histogram (and density curve) from a ValueHistogram, like sns.histplot.
+
+    With hue=True one histogram per group is drawn, each normalized on its own
+    (common_norm=False); otherwise all groups are pooled.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    ax = ax or plt.gca()
+    edges = hist.bin_edges(bins)
+    groups = hist.groups if hue else [None]
+    palette = dict(zip(groups, sns.color_palette(n_colors=len(groups))))
+
+    # The bins are passed as count and range: seaborn rejects an array of edges with weights.
+    frame = hist.to_frame()
+    binning = dict(bins=len(edges) - 1, binrange=(edges[0], edges[-1]))
+    if hue:
+        sns.histplot(data=frame, x='value', weights='count', hue='group', hue_order=groups, stat=stat,
+                     common_norm=False, palette=palette, ax=ax, **binning)
+        ax.get_legend().set_title('usertype')
+    else:
+        sns.histplot(data=frame, x='value', weights='count', stat=stat, ax=ax, **binning)
+
+    if kde:
+        for group in groups:
+            grid, density = hist.kde(group)
+            if stat == 'count':
+                density = density * hist.points(group)[1].sum() * np.diff(edges).mean()
+            ax.plot(grid, density, color=palette[group] if hue else None)
+    return ax
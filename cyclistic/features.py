@@ -0,0 +1,48 @@
+# Derived columns of the cleaned trips: 'start_hour' (cell 19), 'day_of_week' (cell 28) and
+# 'age' (cell 35).
+#
+# They are computed once, as integer codes, when trips are written to the cleaned data
+# cache, and stored next to the source columns, so analyses read them instead of deriving
+# them again. 'day_of_week' comes from .dt.dayofweek as codes of an ordered categorical (no
+# day-name strings are built per row), and 'age' is counted from a fixed REFERENCE_DATE
+# rather than today, so the same data always gives the same ages.
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.schema import FEATURE_SCHEMA
+
+# Ages are the age reached in the year of REFERENCE_DATE (the end of the 2019 data).
+REFERENCE_DATE = pd.Timestamp('2019-12-31')
+
+FEATURE_COLUMNS = list(FEATURE_SCHEMA)
+
+# Bump when the definition of a derived column changes, so cached columns are recomputed.
+FEATURES_VERSION = 1
+
+
+def start_hours(start_time):
+    return start_time.dt.hour.astype(FEATURE_SCHEMA['start_hour'])
+
+
+def days_of_week(start_time):
+    """Day of the week (Monday first) as an ordered categorical, built from integer codes."""
+    codes = start_time.dt.dayofweek.fillna(-1).to_numpy(dtype=np.int8)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=FEATURE_SCHEMA['day_of_week']), index=start_time.index)
+
+
+def ages(birthyear, reference_date=REFERENCE_DATE):
+    return (pd.Timestamp(reference_date).year - birthyear.astype('Int16')).astype(FEATURE_SCHEMA['age'])
+
+
+def add_features(df, reference_date=REFERENCE_DATE):
+    """Add (or recompute) the derived columns of a cleaned trips frame in place and return it."""
+    df['start_hour'] = start_hours(df['start_time'])
+    df['day_of_week'] = days_of_week(df['start_time'])
+    df['age'] = ages(df['birthyear'], reference_date)
+    return df
+
+
+def feature_key(reference_date=REFERENCE_DATE):
+    """Identify how the derived columns were computed, for the cache manifest."""
+    return {'version': FEATURES_VERSION, 'reference_date': pd.Timestamp(reference_date).strftime('%Y-%m-%d')}
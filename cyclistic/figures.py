@@ -0,0 +1,157 @@
+# The notebook's figures, drawn from precomputed tables instead of the trips frame.
+#
+# Every function takes the tables built by figure_tables() and returns a matplotlib
+# figure with the same content, titles and labels as the corresponding notebook cell.
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from cyclistic.density import histplot
+
+
+def figure_tables(aggregates, histograms):
+    """Collect everything the figures need from a TripAggregates and build_histograms() output."""
+    durations = histograms['tripduration']
+    return {
+        'durations': durations,
+        'filtered_durations': durations.between(60, 3600, inclusive='neither'),
+        'ages': histograms['age'].between(right=90.0),
+        'trips_by_hour': aggregates.trips_by_hour(),
+        'trips_by_usertype': aggregates.trips_by_usertype(),
+        'trips_by_gender': aggregates.trips_by_gender(),
+        'top_start_stations': aggregates.top_start_stations(10),
+        'top_end_stations': aggregates.top_end_stations(10),
+        'mean_tripduration_by_day_usertype': aggregates.mean_tripduration_by_day_usertype(),
+        'hourly_counts': aggregates.hourly_counts(),
+        'trips_by_day_usertype': aggregates.trips_by_day_usertype(),
+        'gender_user_type': aggregates.gender_user_type(),
+    }
+
+
+def labelled(ax, title, xlabel, ylabel):
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    return ax.figure
+
+
+def trip_durations(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    histplot(tables['durations'], bins=100, ax=ax)
+    return labelled(ax, 'Distribution of Trip Durations (in seconds)', 'Trip Duration (seconds)', 'Frequency')
+
+
+def trip_durations_filtered(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    histplot(tables['filtered_durations'], bins=100, ax=ax)
+    return labelled(ax, 'Distribution of Trip Durations (in seconds) - Filtered', 'Trip Duration (seconds)',
+                    'Frequency')
+
+
+def count_bars(counts, ax):
+    """Bars of precomputed counts, drawn like sns.countplot over the raw column."""
+    sns.barplot(x=counts.index, y=counts.values, order=list(counts.index), palette='viridis', ax=ax)
+
+
+def trips_by_hour(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    count_bars(tables['trips_by_hour'], ax)
+    return labelled(ax, 'Number of Trips by Hour of the Day', 'Hour of the Day', 'Number of Trips')
+
+
+def trips_by_usertype(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    count_bars(tables['trips_by_usertype'], ax)
+    return labelled(ax, 'Trip Distribution by User Type', 'User Type', 'Trip Count')
+
+
+def trips_by_gender(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    count_bars(tables['trips_by_gender'], ax)
+    return labelled(ax, 'Trips by Gender', 'Gender', 'Count')
+
+
+def top_start_stations(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    top = tables['top_start_stations']
+    sns.barplot(y=top.index, x=top.values, palette='viridis', ax=ax)
+    return labelled(ax, 'Top 10 Start Stations', 'Number of Trips', 'Start Station')
+
+
+def top_end_stations(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    top = tables['top_end_stations']
+    sns.barplot(y=top.index, x=top.values, palette='viridis', ax=ax)
+    return labelled(ax, 'Top 10 End Stations', 'Number of Trips', 'End Station')
+
+
+def trip_durations_by_usertype(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    histplot(tables['filtered_durations'], bins=50, hue=True, stat='density', ax=ax)
+    return labelled(ax, 'Normalized Trip Duration Distribution by User Type', 'Trip Duration (seconds)', 'Density')
+
+
+def mean_duration_by_day(tables):
+    fig, ax = plt.subplots(figsize=(12, 8))
+    sns.barplot(data=tables['mean_tripduration_by_day_usertype'], x='day_of_week', y='tripduration', hue='usertype',
+                palette='viridis', ax=ax)
+    return labelled(ax, 'Mean Trip Duration by Day of the Week for Each User Type', 'Day of the Week',
+                    'Mean Trip Duration (Seconds)')
+
+
+def hourly_percent(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.lineplot(data=tables['hourly_counts'], x='start_hour', y='percent', hue='usertype', ax=ax)
+    return labelled(ax, 'Normalized Trips by Hour of the Day and User Type', 'Hour of the Day', 'Percentage of Trips')
+
+
+def proportion_by_day(tables):
+    fig, ax = plt.subplots(figsize=(12, 8))
+    sns.barplot(data=tables['trips_by_day_usertype'], x='day_of_week', y='proportion_of_trips', hue='usertype', ax=ax)
+    ax.legend(title='User Type')
+    return labelled(ax, 'Proportion of Trips by User Type In Each Day of the Week', 'Day of the Week',
+                    'Proportion of Trips')
+
+
+def trips_by_day(tables):
+    fig, ax = plt.subplots(figsize=(12, 8))
+    sns.barplot(data=tables['trips_by_day_usertype'], x='day_of_week', y='trip_count', hue='usertype', ax=ax)
+    for container in ax.containers:
+        ax.bar_label(container)
+    ax.legend(title='User Type')
+    return labelled(ax, 'Absolute Number of Trips by Day of the Week and User Type', 'Day of the Week',
+                    'Number of Trips')
+
+
+def ages_by_usertype(tables):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    histplot(tables['ages'], bins=30, hue=True, stat='density', ax=ax)
+    return labelled(ax, 'Normalized Age Distribution by User Type', 'Age', 'Frequency')
+
+
+def gender_pies(tables):
+    gender_user_type = tables['gender_user_type']
+    fig, axes = plt.subplots(1, 2, figsize=(14, 7))
+    for ax, usertype in zip(axes, gender_user_type.index):
+        ax.pie(gender_user_type.loc[usertype], labels=gender_user_type.columns, autopct='%1.1f%%', startangle=140)
+        ax.set_title(f'Gender Distribution for {usertype}')
+    return fig
+
+
+# (name, notebook cell, function) of every figure, in notebook order.
+FIGURES = [
+    ('trip_durations', 16, trip_durations),
+    ('trip_durations_filtered', 18, trip_durations_filtered),
+    ('trips_by_hour', 19, trips_by_hour),
+    ('trips_by_usertype', 20, trips_by_usertype),
+    ('trips_by_gender', 21, trips_by_gender),
+    ('top_start_stations', 23, top_start_stations),
+    ('top_end_stations', 25, top_end_stations),
+    ('trip_durations_by_usertype', 27, trip_durations_by_usertype),
+    ('mean_duration_by_day', 28, mean_duration_by_day),
+    ('hourly_percent', 29, hourly_percent),
+    ('proportion_by_day', 30, proportion_by_day),
+    ('trips_by_day', 31, trips_by_day),
+    ('ages_by_usertype', 38, ages_by_usertype),
+    ('gender_pies', 39, gender_pies),
+]
@@ -0,0 +1,144 @@
+# Secondary indexes over the column store (cyclistic.columnstore).
+#
+# A sorted index on a key column holds the row numbers of the store ordered by key, with
+# the distinct keys and the offset at which the rows of each key start (like the row
+# pointers of a CSR matrix):
+#
+#   keys     [k0, k1, k2]
+#   offsets  [0, 3, 4, 9]        rows of k1 are rows[3:4]
+#   rows     [...]               row numbers, ascending within each key
+#
+# A lookup is a binary search in `keys` and a slice of `rows`, so it touches only the matching
+# rows. The arrays are .npy files opened memory-mapped. New rows appended to the store always
+# come after the indexed ones, so an update merges them in with one linear pass instead of
+# sorting everything again.
+
+import json
+import os
+
+import numpy as np
+
+
+INDEX_DIR = 'indexes'
+INDEX_META = 'indexes.json'
+
+# Indexed keys: station ids, user type codes and the start date of the trip.
+INDEXED_COLUMNS = ['from_station_id', 'to_station_id', 'usertype', 'start_date']
+
+
+def sorted_index(keys, first_row=0):
+    """Build (keys, offsets, rows) for `keys`, the key of rows first_row, first_row + 1, ..."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    distinct, starts = np.unique(sorted_keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.int64)
+    return distinct, offsets, (order + first_row).astype(np.int64)
+
+
+def merge_indexes(old, new):
+    """Merge the index of appended rows into an existing index (every new row > every old row)."""
+    old_keys, old_offsets, old_rows = old
+    new_keys, new_offsets, new_rows = new
+    keys = np.union1d(old_keys, new_keys)
+
+    # number of old and new rows with each merged key
+    old_counts = np.zeros(len(keys), dtype=np.int64)
+    old_counts[np.searchsorted(keys, old_keys)] = np.diff(old_offsets)
+    new_counts = np.zeros(len(keys), dtype=np.int64)
+    new_counts[np.searchsorted(keys, new_keys)] = np.diff(new_offsets)
+    offsets = np.append(0, np.cumsum(old_counts + new_counts))
+
+    # within each key the old rows come first, then the new ones
+    old_starts = np.cumsum(old_counts) - old_counts
+    new_starts = np.cumsum(new_counts) - new_counts
+    old_key = np.repeat(np.arange(len(keys)), old_counts)
+    new_key = np.repeat(np.arange(len(keys)), new_counts)
+    rows = np.empty(len(old_rows) + len(new_rows), dtype=np.int64)
+    rows[np.arange(len(old_rows)) + (offsets[:-1] - old_starts)[old_key]] = old_rows
+    rows[np.arange(len(new_rows)) + (offsets[:-1] + old_counts - new_starts)[new_key]] = new_rows
+    return keys, offsets, rows
+
+
+class TripIndexes:
+    """The sorted indexes of a column store, kept in <store_dir>/indexes/."""
+
+    def __init__(self, store):
+        self.store = store
+        self.index_dir = os.path.join(store.store_dir, INDEX_DIR)
+        path = os.path.join(self.index_dir, INDEX_META)
+        self.meta = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.meta = json.load(f)
+        self._indexes = {}
+
+    def __contains__(self, column):
+        # an index that misses appended rows is not used until it is updated
+        return self.meta.get(column) == len(self.store)
+
+    def path(self, column, part):
+        return os.path.join(self.index_dir, f'{column}.{part}.npy')
+
+    def index(self, column):
+        if column not in self._indexes:
+            self._indexes[column] = tuple(np.load(self.path(column, part), mmap_mode='r')
+                                          for part in ('keys', 'offsets', 'rows'))
+        return self._indexes[column]
+
+    def write(self, column, index):
+        os.makedirs(self.index_dir, exist_ok=True)
+        for part, values in zip(('keys', 'offsets', 'rows'), index):
+            np.save(self.path(column, part) + '.tmp.npy', values)
+            os.replace(self.path(column, part) + '.tmp.npy', self.path(column, part))
+        self._indexes.pop(column, None)
+
+    def write_meta(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        path = os.path.join(self.index_dir, INDEX_META)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(path + '.tmp', path)
+
+    def update(self, columns=INDEXED_COLUMNS):
+        """Index the rows appended since the last update (all rows for a new index)."""
+        rows = len(self.store)
+        for column in columns:
+            indexed = self.meta.get(column, 0)
+            if indexed == rows:
+                continue
+            new = sorted_index(self.store.keys(column, slice(indexed, rows)), indexed)
+            index = new if indexed == 0 else merge_indexes(tuple(map(np.asarray, self.index(column))), new)
+            self.write(column, index)
+            self.meta[column] = rows
+        self.write_meta()
+        return self
+
+    def positions(self, column, values):
+        """Positions in the index's keys of those of `values` that occur in the store."""
+        keys = self.index(column)[0]
+        values = self.store.key_values(column, values)
+        if len(keys) == 0:
+            return np.empty(0, dtype=np.int64)
+        positions = np.searchsorted(keys, values)
+        found = (positions < len(keys)) & (keys[np.minimum(positions, len(keys) - 1)] == values)
+        return positions[found]
+
+    def count(self, column, values):
+        """Number of rows whose `column` is one of `values`, read from the offsets only."""
+        offsets = self.index(column)[1]
+        positions = self.positions(column, values)
+        return int(np.sum(offsets[positions + 1] - offsets[positions]))
+
+    def lookup(self, column, values):
+        """Row numbers (ascending) of the rows whose `column` is one of `values`."""
+        _, offsets, rows = self.index(column)
+        slices = [rows[offsets[p]:offsets[p + 1]] for p in self.positions(column, values)]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        if len(slices) == 1:
+            return np.asarray(slices[0])
+        return np.sort(np.concatenate(slices))
+
+
+def update_indexes(store, columns=INDEXED_COLUMNS):
+    return TripIndexes(store).update(columns)
@@ -0,0 +1,215 @@
+# Named pipeline stages with pluggable instrumentation hooks.
+#
+# Code runs inside `with run.stage('name') as stage:` blocks. Hooks are notified when a
+# stage starts and finishes and add their measurements to the stage's metrics: wall and CPU
+# time, memory delta, and optionally a cProfile summary or a tracemalloc snapshot diff. A
+# stage entered several times (e.g. once per chunk) accumulates its metrics. At the end of
+# the run the metrics of every stage are collected into a JSON run report.
+
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+
+def current_rss():
+    """Resident set size of this process in bytes (None where /proc is not available)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.rows = 0
+        self.metrics = {}
+
+    def add(self, key, value):
+        """Add `value` to a metric, starting from 0 the first time the stage reports it."""
+        self.metrics[key] = self.metrics.get(key, 0) + value
+
+    def to_dict(self):
+        return dict({'stage': self.name, 'calls': self.calls, 'rows': self.rows}, **self.metrics)
+
+
+class Hook:
+    """Base class of the instrumentation hooks; every method is optional."""
+
+    def stage_started(self, stage):
+        pass
+
+    def stage_finished(self, stage):
+        pass
+
+    def run_finished(self, report):
+        pass
+
+
+class TimingHook(Hook):
+    def stage_started(self, stage):
+        stage._timing = (time.perf_counter(), time.process_time())
+
+    def stage_finished(self, stage):
+        wall, cpu = stage._timing
+        stage.add('wall_s', time.perf_counter() - wall)
+        stage.add('cpu_s', time.process_time() - cpu)
+
+
+class MemoryHook(Hook):
+    """Resident memory at the end of the stage, and how much it grew during the stage."""
+
+    def stage_started(self, stage):
+        stage._rss = current_rss()
+
+    def stage_finished(self, stage):
+        rss = current_rss()
+        if rss is None or stage._rss is None:
+            return
+        stage.add('rss_delta_mb', (rss - stage._rss) / 2**20)
+        stage.metrics['rss_mb'] = rss / 2**20
+
+
+class ProfileHook(Hook):
+    """cProfile the stages (all of them, or only `stages`) and report their top functions.
+
+    Nested stages are covered by the profile of the enclosing stage. With `dump_dir`, the
+    raw profile of every stage is also written to <dump_dir>/<stage>.prof.
+    """
+
+    def __init__(self, stages=None, top=15, dump_dir=None):
+        self.stages = stages
+        self.top = top
+        self.dump_dir = dump_dir
+        self.active = None
+        self.profiles = {}
+
+    def stage_started(self, stage):
+        if self.active is not None or (self.stages is not None and stage.name not in self.stages):
+            return
+        self.active = stage.name
+        self.profiles.setdefault(stage.name, cProfile.Profile()).enable()
+
+    def stage_finished(self, stage):
+        if self.active != stage.name:
+            return
+        profile = self.profiles[stage.name]
+        profile.disable()
+        self.active = None
+
+        stats = pstats.Stats(profile, stream=io.StringIO()).sort_stats('cumulative')
+        top = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            top.append({'function': f'{os.path.basename(filename)}:{line}({function})', 'calls': calls,
+                        'own_s': round(own, 4), 'cumulative_s': round(cumulative, 4)})
+        top.sort(key=lambda entry: entry['cumulative_s'], reverse=True)
+        stage.metrics['profile'] = top[:self.top]
+
+        if self.dump_dir:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(self.dump_dir, f'{stage.name}.prof'))
+
+
+class TracemallocHook(Hook):
+    """Report the allocations made during each stage, by line, from tracemalloc snapshots.
+
+    'traced_peak_mb' is the peak traced memory during the stage, including its nested stages:
+    tracemalloc has a single peak, so it is reset when a stage starts, and the peaks of the
+    open stages are carried on a stack (an inner stage's peak raises its outer stage's).
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.snapshots = {}
+        self.peaks = []
+
+    def stage_started(self, stage):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+        self.snapshots[stage.name] = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        self.peaks.append(0)
+
+    def stage_finished(self, stage):
+        peak = max(self.peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], peak)
+        diff = tracemalloc.take_snapshot().compare_to(self.snapshots.pop(stage.name), 'lineno')
+        stage.metrics['allocations'] = [
+            {'line': str(entry.traceback), 'size_diff_mb': round(entry.size_diff / 2**20, 3), 'count_diff': entry.count_diff}
+            for entry in diff[:self.top]
+        ]
+        stage.metrics['traced_peak_mb'] = max(stage.metrics.get('traced_peak_mb', 0), peak / 2**20)
+
+
+class JsonReportHook(Hook):
+    """Write the run report to a JSON file when the run finishes."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def run_finished(self, report):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+DEFAULT_HOOKS = (TimingHook, MemoryHook)
+
+
+class Run:
+    """One instrumented run of the pipeline.
+
+    With hooks=None the timing and memory hooks are used; pass extra hooks (ProfileHook,
+    TracemallocHook, JsonReportHook, or your own Hook subclass) to add to them.
+    """
+
+    def __init__(self, hooks=None, **info):
+        self.hooks = [hook() for hook in DEFAULT_HOOKS] + list(hooks or [])
+        self.info = info
+        self.stages = {}
+        self.started = datetime.datetime.now()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stage = self.stages.setdefault(name, Stage(name))
+        stage.calls += 1
+        for hook in self.hooks:
+            hook.stage_started(stage)
+        try:
+            yield stage
+        finally:
+            for hook in reversed(self.hooks):
+                hook.stage_finished(stage)
+
+    def report(self):
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+            'info': self.info,
+            'stages': [stage.to_dict() for stage in self.stages.values()],
+        }
+
+    def finish(self):
+        """Build the run report and hand it to every hook; returns the report."""
+        report = self.report()
+        for hook in self.hooks:
+            hook.run_finished(report)
+        return report
+
+
+def stage(run, name):
+    """run.stage(name), or a no-op stage when there is no run to report to."""
+    return run.stage(name) if run is not None else contextlib.nullcontext(Stage(name))
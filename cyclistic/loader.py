@@ -0,0 +1,169 @@
+# Streaming ingestion of the quarterly Divvy trip files.
+#
+# The notebook loads one quarter with a single pd.read_csv. Here the files are read in
+# bounded-size chunks and each chunk goes through the same cleaning steps (cells 7-12),
+# so memory only depends on the chunk size and not on how many quarters are loaded.
+
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.instrument import stage
+from cyclistic.schema import apply_trip_schema, concat_trips
+
+
+# Number of rows read from a CSV file at a time.
+CHUNK_SIZE = 250_000
+
+# Columns whose inferred type could change from one chunk to the next. 'tripduration' contains
+# ',' thousands separators only in some rows, and 'gender' can be missing for a whole chunk,
+# so reading them as text keeps every chunk identical to the whole-file read.
+RAW_DTYPES = {
+    'tripduration': str,
+    'start_time': str,
+    'end_time': str,
+    'gender': str,
+}
+
+# Integer id columns of the raw files.
+ID_COLUMNS = ['trip_id', 'bikeid', 'from_station_id', 'to_station_id']
+
+# Fixed layout of the Divvy 'start_time'/'end_time' values: 'YYYY-MM-DD HH:MM:SS', with
+# the separator at each of these positions and a digit everywhere else.
+TIMESTAMP_LENGTH = 19
+TIMESTAMP_SEPARATORS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}
+
+# A time zone designator at the end of a timestamp ('Z', '+05:00', '-0600').
+TIME_ZONE_SUFFIX = re.compile(r'(?:Z|[+-]\d{2}:?\d{2})$')
+
+
+def find_quarter_files(directory):
+    """Return the Divvy quarterly trip files in a directory, oldest quarter first."""
+    return sorted(glob.glob(os.path.join(directory, 'Divvy_Trips_*_Q*.csv')))
+
+
+def layout_bounds():
+    """Smallest and largest byte allowed at every position of the layout."""
+    low = np.full(TIMESTAMP_LENGTH + 1, ord('0'), dtype=np.uint8)
+    high = np.full(TIMESTAMP_LENGTH + 1, ord('9'), dtype=np.uint8)
+    for position, separator in TIMESTAMP_SEPARATORS.items():
+        low[position] = high[position] = ord(separator)
+    # one byte past the layout must be empty: longer values do not match
+    low[TIMESTAMP_LENGTH] = high[TIMESTAMP_LENGTH] = 0
+    return low, high
+
+
+def fixed_layout(chars):
+    """Mask of the rows of a (rows x 20) byte matrix that are in the Divvy layout."""
+    low, high = layout_bounds()
+    return ((chars >= low) & (chars <= high)).all(axis=1)
+
+
+def parse_timestamps(values, errors='raise'):
+    """Convert Divvy 'YYYY-MM-DD HH:MM:SS' strings to naive datetime64[ns].
+
+    Every value is checked against the fixed layout on a (rows x 20) byte matrix (see
+    fixed_layout()), and the values in the layout are converted by NumPy's ISO 8601 parser
+    in one vectorized cast, without pd.to_datetime's format inference. Only the values that
+    are not in the layout (missing values, fractional seconds, other layouts) are parsed by
+    pd.to_datetime. Values with a time zone are not accepted, as the column holds naive
+    local times. Like pd.to_datetime, errors='raise' raises on a value that cannot be parsed
+    and errors='coerce' turns it into NaT.
+    """
+    values = pd.Series(values)
+    result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+    try:
+        text = values.to_numpy(dtype=object).astype(f'S{TIMESTAMP_LENGTH + 1}')
+    except UnicodeEncodeError:
+        fixed = np.zeros(len(values), dtype=bool)
+    else:
+        fixed = fixed_layout(text.view(np.uint8).reshape(len(text), TIMESTAMP_LENGTH + 1))
+        try:
+            result[fixed] = text[fixed].astype('datetime64[s]')
+        except ValueError:
+            # in the layout but not a valid date or time ('2019-02-30', '24:00:00')
+            fixed[:] = False
+
+    rest = np.flatnonzero(~fixed)
+    if len(rest):
+        others = values.iloc[rest]
+        present = others.notna().to_numpy()
+        rest, others = rest[present], others[present].astype(str)
+        zoned = others.str.contains(TIME_ZONE_SUFFIX).to_numpy()
+        if zoned.any() and errors == 'raise':
+            raise ValueError(f'Time zones are not supported: {others[zoned].iloc[0]!r}')
+        parsed = pd.to_datetime(others[~zoned], format='mixed', errors=errors)
+        if getattr(parsed.dtype, 'tz', None) is not None:
+            # a time zone spelled another way ('UTC', 'CST', ...)
+            if errors == 'raise':
+                raise ValueError(f'Time zones are not supported: {others[~zoned].iloc[0]!r}')
+            parsed = pd.Series(pd.NaT, index=parsed.index, dtype='datetime64[ns]')
+        result[rest[~zoned]] = parsed.to_numpy(dtype='datetime64[ns]')
+    return pd.Series(result, index=values.index, name=values.name)
+
+
+def clean_trips(df, run=None, errors='raise'):
+    """Apply the notebook's cleaning steps (cells 7-12) to a frame of raw trips.
+
+    With an instrument.Run, the timestamp parsing is reported as its own stage. With
+    errors='coerce', a 'tripduration', timestamp or id that cannot be parsed becomes missing
+    instead of raising, so that validation.Validator can count and drop the row.
+    """
+    # Fill missing gender values with 'Unknown'.
+    df['gender'] = df['gender'].fillna('Unknown')
+
+    if errors == 'coerce':
+        # read_csv parses the ids as numbers; a malformed one leaves its column as text
+        for col in ID_COLUMNS:
+            if col in df.columns and df[col].dtype == object:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Strip 'tripduration' of commas before converting it to numeric.
+    df['tripduration'] = pd.to_numeric(df['tripduration'].str.replace(',', ''), errors=errors)
+
+    # Convert 'start_time' and 'end_time' to datetime.
+    with stage(run, 'parse_timestamps') as timestamps:
+        df['start_time'] = parse_timestamps(df['start_time'], errors=errors)
+        df['end_time'] = parse_timestamps(df['end_time'], errors=errors)
+        timestamps.rows += len(df)
+
+    # Convert birthyear column to numeric, while coercing errors.
+    df['birthyear'] = pd.to_numeric(df['birthyear'], errors='coerce')
+    return df
+
+
+def iter_raw_chunks(paths, chunksize=CHUNK_SIZE, usecols=None):
+    """Yield uncleaned chunks of at most `chunksize` trips from one or more CSV files."""
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    for path in paths:
+        reader = pd.read_csv(path, chunksize=chunksize, dtype=RAW_DTYPES, usecols=usecols)
+        with reader:
+            yield from reader
+
+
+def iter_trip_chunks(paths, chunksize=CHUNK_SIZE, usecols=None, compact=True):
+    """Yield cleaned chunks of at most `chunksize` trips from one or more CSV files.
+
+    With compact=True (the default) each chunk is cast to the compact TRIP_SCHEMA.
+    """
+    for chunk in iter_raw_chunks(paths, chunksize=chunksize, usecols=usecols):
+        chunk = clean_trips(chunk)
+        yield apply_trip_schema(chunk) if compact else chunk
+
+
+def load_trips(paths, chunksize=CHUNK_SIZE, compact=True):
+    """Load and clean one or more quarterly files into a single frame.
+
+    The result is the same frame the notebook builds with pd.read_csv followed by
+    cells 7-12 (and apply_trip_schema when `compact`), but the raw text of only one
+    chunk is held in memory at a time.
+    """
+    chunks = iter_trip_chunks(paths, chunksize=chunksize, compact=compact)
+    if compact:
+        return concat_trips(chunks)
+    return pd.concat(list(chunks), ignore_index=True)
@@ -0,0 +1,213 @@
+# Origin-destination (OD) matrices: trips between every pair of stations.
+#
+# The notebook notices that the top start stations are also the top end stations (cells
+# 22-25) but never measures the flows between stations. Here every trip is counted into a
+# from_station_id x to_station_id sparse matrix per (usertype, hour band), in one vectorized
+# pass: the matrices of all the groups are stacked on top of each other into one
+# (groups * stations) x stations scipy.sparse CSR matrix, built from a single COO matrix
+# whose duplicate entries are summed. Only station pairs with trips are stored, so the
+# matrices stay small whatever the number of trips, and chunks or quarters are merged by
+# adding them.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from cyclistic.aggregate import DURATION_RANGE, category_codes
+from cyclistic.schema import USERTYPES
+
+
+# Hour bands of the trip start: (name, first hour, last hour + 1).
+HOUR_BANDS = [
+    ('night', 0, 6),
+    ('morning', 6, 10),
+    ('midday', 10, 15),
+    ('evening', 15, 19),
+    ('late', 19, 24),
+]
+BAND_NAMES = [name for name, _, _ in HOUR_BANDS]
+BAND_OF_HOUR = np.concatenate([np.full(end - start, i) for i, (_, start, end) in enumerate(HOUR_BANDS)])
+
+# trips -- all trips; duration_count / duration_sum -- trips within DURATION_RANGE, for means
+MEASURES = ['trips', 'duration_count', 'duration_sum']
+
+
+def n_groups():
+    return len(USERTYPES) * len(HOUR_BANDS)
+
+
+def stacked(values, group, from_station, to_station, n_stations):
+    """Sum `values` into a (groups * n_stations) x n_stations CSR matrix (duplicates are added)."""
+    rows = group * n_stations + from_station
+    shape = (n_groups() * n_stations, n_stations)
+    return sparse.coo_matrix((values, (rows, to_station)), shape=shape).tocsr()
+
+
+def relayout(matrix, n_stations, new_n_stations):
+    """Re-stack a matrix built for `n_stations` stations for a larger number of stations."""
+    if n_stations == new_n_stations:
+        return matrix
+    coo = matrix.tocoo()
+    group, from_station = np.divmod(coo.row, n_stations)
+    return stacked(coo.data, group, from_station, coo.col, new_n_stations)
+
+
+class ODMatrices:
+    """Trip counts and durations between stations per (usertype, hour band).
+
+    Every measure is a (groups * n_stations) x n_stations CSR matrix; rows
+    [g * n_stations, (g + 1) * n_stations) hold group g = usertype code * len(HOUR_BANDS) + band,
+    indexed by from_station_id, and columns by to_station_id.
+    """
+
+    def __init__(self, measures, n_stations, station_names=None):
+        self.measures = measures
+        self.n_stations = n_stations
+        self.station_names = station_names or {}
+
+    @classmethod
+    def from_trips(cls, df):
+        """Build the matrices from a frame of cleaned trips in one pass."""
+        usertype = category_codes(df['usertype'], USERTYPES)
+        if 'start_hour' in df.columns:
+            hour = df['start_hour'].fillna(-1).to_numpy(dtype=np.int64)
+        else:
+            hour = df['start_time'].dt.hour.fillna(-1).to_numpy(dtype=np.int64)
+        from_station = df['from_station_id'].to_numpy(dtype=np.int64)
+        to_station = df['to_station_id'].to_numpy(dtype=np.int64)
+        valid = (usertype >= 0) & (hour >= 0) & (from_station >= 0) & (to_station >= 0)
+
+        n_stations = int(max(from_station.max(initial=-1), to_station.max(initial=-1))) + 1
+        group = usertype[valid].astype(np.int64) * len(HOUR_BANDS) + BAND_OF_HOUR[hour[valid]]
+        from_station, to_station = from_station[valid], to_station[valid]
+
+        duration = df['tripduration'].to_numpy(dtype=np.float64)[valid]
+        low, high = DURATION_RANGE
+        in_range = (duration > low) & (duration < high)
+
+        measures = {
+            'trips': stacked(np.ones(len(group), dtype=np.int64), group, from_station, to_station, n_stations),
+            'duration_count': stacked(in_range.astype(np.int64), group, from_station, to_station, n_stations),
+            'duration_sum': stacked(np.where(in_range, duration, 0), group, from_station, to_station, n_stations),
+        }
+        for matrix in measures.values():
+            matrix.eliminate_zeros()
+        return cls(measures, n_stations, collect_station_names(df))
+
+    def merge(self, other):
+        """Return the matrices of the union of the trips behind `self` and `other`."""
+        n_stations = max(self.n_stations, other.n_stations)
+        measures = {
+            name: relayout(self.measures[name], self.n_stations, n_stations)
+            + relayout(other.measures[name], other.n_stations, n_stations)
+            for name in MEASURES
+        }
+        return ODMatrices(measures, n_stations, {**other.station_names, **self.station_names})
+
+    def groups(self, usertype=None, band=None):
+        """Group numbers of a usertype and/or hour band (None selects all)."""
+        usertypes = range(len(USERTYPES)) if usertype is None else [USERTYPES.index(usertype)]
+        bands = range(len(HOUR_BANDS)) if band is None else [BAND_NAMES.index(band)]
+        return [u * len(HOUR_BANDS) + b for u in usertypes for b in bands]
+
+    def matrix(self, measure='trips', usertype=None, band=None):
+        """The n_stations x n_stations matrix of a measure, summed over the selected groups."""
+        stack = self.measures[measure]
+        n = self.n_stations
+        total = None
+        for g in self.groups(usertype, band):
+            block = stack[g * n:(g + 1) * n]
+            total = block if total is None else total + block
+        return total
+
+    def mean_duration(self, usertype=None, band=None):
+        """Sparse matrix of the mean duration (seconds, trips within DURATION_RANGE) per station pair."""
+        count = self.matrix('duration_count', usertype, band).tocoo()
+        total = self.matrix('duration_sum', usertype, band).tocsr()
+        means = np.asarray(total[count.row, count.col]).ravel() / count.data
+        return sparse.coo_matrix((means, (count.row, count.col)), shape=count.shape).tocsr()
+
+    def round_trip_share(self, usertype=None, band=None):
+        """Percentage of trips that end at the station they started from."""
+        trips = self.matrix('trips', usertype, band)
+        total = trips.sum()
+        return float(trips.diagonal().sum() / total * 100) if total else np.nan
+
+    def round_trip_shares(self):
+        """Round-trip percentage per usertype (rows) and hour band (columns)."""
+        return pd.DataFrame(
+            [[self.round_trip_share(usertype, band) for band in BAND_NAMES] for usertype in USERTYPES],
+            index=pd.Index(USERTYPES, name='usertype'), columns=pd.Index(BAND_NAMES, name='hour_band'),
+        )
+
+    def top_corridors(self, n=10, usertype=None, band=None, round_trips=True):
+        """The `n` station pairs with the most trips, with their mean duration."""
+        trips = self.matrix('trips', usertype, band).tocoo()
+        keep = np.ones(trips.nnz, dtype=bool) if round_trips else trips.row != trips.col
+        rows, cols, counts = trips.row[keep], trips.col[keep], trips.data[keep]
+        top = np.argsort(-counts, kind='stable')[:n]
+        rows, cols = rows[top], cols[top]
+        means = np.asarray(self.mean_duration(usertype, band)[rows, cols]).ravel()
+        return pd.DataFrame({
+            'from_station_id': rows,
+            'from_station_name': [self.station_names.get(int(s)) for s in rows],
+            'to_station_id': cols,
+            'to_station_name': [self.station_names.get(int(s)) for s in cols],
+            'trips': counts[top],
+            'mean_tripduration': np.where(means > 0, means, np.nan),
+        })
+
+    def net_flow(self, usertype=None, band=None):
+        """Departures, arrivals and net flow (arrivals - departures) of every station with trips."""
+        trips = self.matrix('trips', usertype, band)
+        departures = np.asarray(trips.sum(axis=1)).ravel()
+        arrivals = np.asarray(trips.sum(axis=0)).ravel()
+        stations = np.flatnonzero(departures + arrivals)
+        table = pd.DataFrame({
+            'station_name': [self.station_names.get(int(s)) for s in stations],
+            'departures': departures[stations],
+            'arrivals': arrivals[stations],
+            'net_flow': arrivals[stations] - departures[stations],
+        }, index=pd.Index(stations, name='station_id'))
+        return table.sort_values('net_flow', kind='stable')
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, matrix in self.measures.items():
+            sparse.save_npz(os.path.join(directory, f'{name}.npz'), matrix)
+        with open(os.path.join(directory, 'stations.json'), 'w') as f:
+            json.dump({'n_stations': self.n_stations, 'station_names': self.station_names}, f)
+
+    @classmethod
+    def read(cls, directory):
+        measures = {name: sparse.load_npz(os.path.join(directory, f'{name}.npz')).tocsr() for name in MEASURES}
+        with open(os.path.join(directory, 'stations.json')) as f:
+            stations = json.load(f)
+        names = {int(station): name for station, name in stations['station_names'].items()}
+        return cls(measures, stations['n_stations'], names)
+
+
+def collect_station_names(df):
+    """{station id: station name} of the start and end stations of the trips."""
+    names = {}
+    for id_column, name_column in (('to_station_id', 'to_station_name'), ('from_station_id', 'from_station_name')):
+        pairs = df[[id_column, name_column]].dropna().drop_duplicates(id_column)
+        names.update(zip(pairs[id_column].astype(int), pairs[name_column].astype(str)))
+    return names
+
+
+def od_matrices(df):
+    """Count the trips of a cleaned frame into ODMatrices."""
+    return ODMatrices.from_trips(df)
+
+
+def od_chunks(chunks):
+    """Build ODMatrices from an iterable of cleaned trip chunks (e.g. iter_trip_chunks)."""
+    matrices = None
+    for chunk in chunks:
+        partial = od_matrices(chunk)
+        matrices = partial if matrices is None else matrices.merge(partial)
+    return matrices
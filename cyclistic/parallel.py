@@ -0,0 +1,107 @@
+# Parallel cleaning and aggregation over a process pool.
+#
+# The per-file cleaning (notebook cells 7-12) and the partial aggregations are independent
+# for every quarterly file or chunk, so they are fanned out to worker processes, one task per
+# file or per chunk. Results are always reduced in task order, and chunk boundaries depend
+# only on `chunksize`, so the final tables are identical whatever the number of workers.
+
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cyclistic.aggregate import aggregate_chunks, aggregate_trips
+from cyclistic.cache import (
+    CACHE_DIR, is_cached, read_manifest, refresh_features, remove_source, renamed_sources, source_entry, source_name,
+    write_manifest, write_partitions,
+)
+from cyclistic.features import REFERENCE_DATE, feature_key
+from cyclistic.loader import CHUNK_SIZE, clean_trips, iter_raw_chunks, iter_trip_chunks
+from cyclistic.schema import apply_trip_schema
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def run_tasks(func, tasks, workers=None):
+    """Yield func(*task) for every task, in task order, using up to `workers` processes.
+
+    At most 2 * workers tasks are in flight at a time, so a long stream of tasks (e.g. chunks
+    read from a file) is never materialized all at once. With workers=1 the tasks run in this
+    process.
+    """
+    workers = workers or default_workers()
+    if workers == 1:
+        for task in tasks:
+            yield func(*task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.submit(func, *task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def aggregate_file(path, chunksize):
+    return aggregate_chunks(iter_trip_chunks(path, chunksize=chunksize))
+
+
+def clean_and_aggregate(raw_chunk):
+    return aggregate_trips(apply_trip_schema(clean_trips(raw_chunk)))
+
+
+def parallel_aggregate(paths, workers=None, chunksize=CHUNK_SIZE, per_chunk=False):
+    """Clean and aggregate quarterly files in parallel into one TripAggregates.
+
+    By default there is one task per file. With per_chunk=True the files are read here and
+    every raw chunk is cleaned and aggregated by a worker, which keeps all the workers busy
+    when there are fewer files than workers.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    if per_chunk:
+        tasks = ((chunk,) for chunk in iter_raw_chunks(paths, chunksize=chunksize))
+        partials = run_tasks(clean_and_aggregate, tasks, workers)
+    else:
+        partials = run_tasks(aggregate_file, [(path, chunksize) for path in paths], workers)
+
+    aggregates = None
+    for partial in partials:
+        aggregates = partial if aggregates is None else aggregates.merge(partial)
+    return aggregates
+
+
+def clean_file_to_cache(path, cache_dir, chunksize, reference_date):
+    return write_partitions(iter_trip_chunks(path, chunksize=chunksize), source_name(path), cache_dir, reference_date)
+
+
+def parallel_build_cache(paths, cache_dir=CACHE_DIR, workers=None, chunksize=CHUNK_SIZE,
+                         reference_date=REFERENCE_DATE):
+    """Parallel version of cache.build_cache: one worker task cleans and caches one file.
+
+    Workers only write their own partition files; the manifest is updated here, once all of
+    them are done. Returns the list of files that were (re)built.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    stale = [path for path in paths if not is_cached(path, cache_dir)]
+    manifest = read_manifest(cache_dir)
+    for path in stale:
+        for name in renamed_sources(path, manifest) + [source_name(path)]:
+            remove_source(name, cache_dir, manifest)
+
+    tasks = [(path, cache_dir, chunksize, reference_date) for path in stale]
+    partitions = list(run_tasks(clean_file_to_cache, tasks, workers))
+
+    manifest = read_manifest(cache_dir)
+    for path, written in zip(stale, partitions):
+        manifest[source_name(path)] = dict(source_entry(path), partitions=written, features=feature_key(reference_date))
+    write_manifest(manifest, cache_dir)
+    refresh_features(cache_dir, reference_date)
+    return stale
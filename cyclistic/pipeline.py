@@ -0,0 +1,118 @@
+# The analysis as a sequence of named, instrumented stages.
+#
+# Mirrors the notebook: read the quarterly CSVs, clean them (cells 7-12), aggregate the
+# tables behind the analysis cells, and render the figures. Every step runs inside an
+# instrument.Run stage, so a run report shows where the time and memory went:
+#
+#   read_csv          pd.read_csv of every chunk
+#   clean             cleaning and compact schema (includes parse_timestamps)
+#   parse_timestamps  start_time / end_time parsing
+#   validate          data-quality rules (with a validation.Validator, inside clean)
+#   aggregate         single-pass aggregation of the user type breakdowns
+#   histograms        binned trip duration and age counts
+#   tables            roll-up of the tables the figures are drawn from
+#   render:<figure>   drawing one figure (and saving it, with an output directory)
+
+import os
+
+from cyclistic.aggregate import aggregate_trips
+from cyclistic.density import ValueHistogram
+from cyclistic.features import REFERENCE_DATE, ages
+from cyclistic.instrument import Run
+from cyclistic.loader import CHUNK_SIZE, clean_trips, iter_raw_chunks
+from cyclistic.schema import apply_trip_schema
+from cyclistic.validation import usable_rows
+
+
+def ingest(paths, run, chunksize=CHUNK_SIZE, reference_date=REFERENCE_DATE, validator=None):
+    """Stream the files through the read_csv, clean, aggregate and histograms stages.
+
+    With a validation.Validator, the chunks are cleaned with errors='coerce' and checked
+    against its rules; the rows failing validation.UNUSABLE_RULES (unparseable values,
+    values outside the schema) are counted, then dropped. The rules run serially in this
+    process, chunk by chunk; validation.validate_files spreads them over worker processes.
+    Returns the TripAggregates and the {'tripduration', 'age'} ValueHistograms.
+    """
+    aggregates = None
+    histograms = {'tripduration': ValueHistogram(), 'age': ValueHistogram()}
+    raw_chunks = iter_raw_chunks(paths, chunksize=chunksize)
+    while True:
+        with run.stage('read_csv') as stage:
+            raw = next(raw_chunks, None)
+            stage.rows += 0 if raw is None else len(raw)
+        if raw is None:
+            break
+
+        with run.stage('clean') as stage:
+            if validator is None:
+                chunk = clean_trips(raw, run=run)
+            else:
+                chunk = clean_trips(raw, run=run, errors='coerce')
+                with run.stage('validate') as validate:
+                    validator.update(chunk)
+                    validate.rows += len(chunk)
+                    usable = usable_rows(chunk)
+                    if not usable.all():
+                        chunk = chunk[usable].copy()
+            chunk = apply_trip_schema(chunk)
+            stage.rows += len(chunk)
+
+        with run.stage('aggregate') as stage:
+            partial = aggregate_trips(chunk)
+            aggregates = partial if aggregates is None else aggregates.merge(partial)
+            stage.rows += len(chunk)
+
+        with run.stage('histograms') as stage:
+            histograms['tripduration'].update(chunk['tripduration'], chunk['usertype'])
+            histograms['age'].update(ages(chunk['birthyear'], reference_date), chunk['usertype'])
+            stage.rows += len(chunk)
+
+    return aggregates, histograms
+
+
+def render(tables, run, output_dir=None, formats=('png',)):
+    """Draw every figure in its own render:<name> stage, saving it when `output_dir` is set."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from cyclistic.figures import FIGURES
+
+    paths = {}
+    for name, _, draw in FIGURES:
+        with run.stage(f'render:{name}'):
+            fig = draw(tables)
+            fig.canvas.draw()
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                for fmt in formats:
+                    path = os.path.join(output_dir, f'{name}.{fmt}')
+                    fig.savefig(path, bbox_inches='tight')
+                    paths.setdefault(name, []).append(path)
+            plt.close(fig)
+    return paths
+
+
+def run_pipeline(paths, hooks=None, chunksize=CHUNK_SIZE, output_dir=None, plots=True, validator=None):
+    """Run every stage over the quarterly files and return (report, aggregates).
+
+    `hooks` are extra instrument hooks, e.g. [ProfileHook(), JsonReportHook('run.json')].
+    With a validation.Validator the data-quality rules run during ingestion; read its
+    summary() afterwards.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    run = Run(hooks, sources=[os.path.abspath(path) for path in paths], chunksize=chunksize)
+
+    aggregates, histograms = ingest(paths, run, chunksize=chunksize, validator=validator)
+    if aggregates is None:
+        raise ValueError('No trips were read from ' + ', '.join(map(str, paths)))
+
+    if plots:
+        from cyclistic.figures import figure_tables
+
+        with run.stage('tables'):
+            tables = figure_tables(aggregates, histograms)
+        render(tables, run, output_dir)
+
+    return run.finish(), aggregates
@@ -0,0 +1,136 @@
+# Lazy queries over the Parquet cache of cleaned trips.
+#
+# Filters such as 60 < tripduration < 3600 used to be applied as boolean masks that copied
+# the whole frame. A TripQuery only records the filter and the columns it needs; when it is
+# run, both are pushed down into the pyarrow dataset scan (partition pruning on year/quarter,
+# row-group statistics, column projection), and group-by aggregations are computed batch by
+# batch, so neither the full frame nor a filtered copy of it is ever materialized.
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from cyclistic.cache import CACHE_DIR, cache_dataset
+from cyclistic.schema import FEATURE_SCHEMA, TRIP_SCHEMA, apply_trip_schema
+
+
+# How each aggregation is computed per batch, and how the partial results are combined.
+PARTIAL_AGGREGATIONS = {
+    'count': [('count', 'sum')],
+    'sum': [('sum', 'sum')],
+    'min': [('min', 'min')],
+    'max': [('max', 'max')],
+    'mean': [('sum', 'sum'), ('count', 'sum')],
+}
+
+
+def field_between(column, left, right, inclusive='both'):
+    """Dataset expression for left <= column <= right, with Series.between's `inclusive`."""
+    field = ds.field(column)
+    lower = field >= left if inclusive in ('both', 'left') else field > left
+    upper = field <= right if inclusive in ('both', 'right') else field < right
+    return lower & upper
+
+
+class TripQuery:
+    """A lazily evaluated selection of cleaned trips from the cache."""
+
+    def __init__(self, cache_dir=CACHE_DIR, columns=None, filter=None):
+        self.cache_dir = cache_dir
+        self.columns = columns
+        self.filter = filter
+
+    def where(self, expression):
+        """Return a query that also requires `expression` (a pyarrow.dataset expression)."""
+        combined = expression if self.filter is None else self.filter & expression
+        return TripQuery(self.cache_dir, self.columns, combined)
+
+    def between(self, column, left, right, inclusive='both'):
+        return self.where(field_between(column, left, right, inclusive))
+
+    def quarters(self, years=None, quarters=None):
+        """Restrict the query to some partitions; the other partitions are never opened."""
+        query = self
+        if years is not None:
+            query = query.where(ds.field('year').isin(list(years)))
+        if quarters is not None:
+            query = query.where(ds.field('quarter').isin(list(quarters)))
+        return query
+
+    def select(self, *columns):
+        return TripQuery(self.cache_dir, list(columns), self.filter)
+
+    def scanner(self, columns=None):
+        return cache_dataset(self.cache_dir).scanner(columns=columns or self.columns, filter=self.filter)
+
+    def to_pandas(self):
+        """Run the query and return the matching trips (only the selected columns)."""
+        return apply_trip_schema(self.scanner().to_table().to_pandas())
+
+    def count(self):
+        return self.scanner(columns=[]).count_rows()
+
+    def groupby(self, keys):
+        return GroupedTripQuery(self, [keys] if isinstance(keys, str) else list(keys))
+
+
+class GroupedTripQuery:
+    def __init__(self, query, keys):
+        self.query = query
+        self.keys = keys
+
+    def agg(self, **aggregations):
+        """Aggregate per group, like DataFrame.groupby(...).agg with named aggregations.
+
+        Each keyword is name=(column, function) with function one of 'count', 'sum', 'min',
+        'max' or 'mean'. Partial aggregates are computed per scanned batch and combined, so
+        memory only depends on the number of groups.
+        """
+        columns = sorted(set(self.keys) | {column for column, _ in aggregations.values()})
+        partial_specs = sorted({
+            (column, partial) for column, func in aggregations.values() for partial, _ in PARTIAL_AGGREGATIONS[func]
+        })
+
+        partials = []
+        for batch in self.query.scanner(columns=columns).to_batches():
+            if batch.num_rows == 0:
+                continue
+            table = pa.Table.from_batches([batch])
+            # Group on plain values: dictionaries differ from one batch to the next.
+            for key in self.keys:
+                key_type = table.schema.field(key).type
+                if pa.types.is_dictionary(key_type):
+                    index = table.schema.get_field_index(key)
+                    table = table.set_column(index, key, table[key].cast(key_type.value_type))
+            partials.append(table.group_by(self.keys).aggregate(partial_specs))
+
+        if not partials:
+            return pd.DataFrame(columns=self.keys + list(aggregations)).set_index(self.keys)
+
+        combine = sorted({
+            (f'{column}_{partial}', how)
+            for column, func in aggregations.values() for partial, how in PARTIAL_AGGREGATIONS[func]
+        })
+        combined = pa.concat_tables(partials).group_by(self.keys).aggregate(combine)
+
+        result = {key: combined[key] for key in self.keys}
+        for name, (column, func) in aggregations.items():
+            if func == 'mean':
+                total = combined[f'{column}_sum_sum'].cast(pa.float64())
+                result[name] = pc.divide(total, combined[f'{column}_count_sum'])
+            else:
+                partial, how = PARTIAL_AGGREGATIONS[func][0]
+                result[name] = combined[f'{column}_{partial}_{how}']
+        frame = pa.table(result).to_pandas()
+        # Restore the schema's categories, so groups sort in their order (Monday first) and not as strings.
+        schema = dict(TRIP_SCHEMA, **FEATURE_SCHEMA)
+        for key in self.keys:
+            dtype = schema.get(key)
+            if isinstance(dtype, pd.CategoricalDtype) and dtype.categories is not None:
+                frame[key] = frame[key].astype(dtype)
+        return frame.sort_values(self.keys).set_index(self.keys)
+
+    def size(self):
+        """Number of trips per group."""
+        return self.agg(size=(self.keys[0], 'count'))['size']
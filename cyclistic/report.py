@@ -0,0 +1,163 @@
+# Headless batch report: every figure rendered to image files and assembled, with the
+# insight tables, into a single HTML page.
+#
+# Figures are drawn on the Agg backend (no display, no plt.show()) from the tables built
+# by figures.figure_tables(), one worker process per figure, so the run needs only the
+# aggregates and histograms, never the trips frame:
+#
+#   report/
+#       report.html
+#       figures/trip_durations.png, trip_durations.svg, ...
+
+import base64
+import html
+import os
+import time
+
+from cyclistic.instrument import stage
+from cyclistic.parallel import run_tasks
+
+REPORT_DIR = 'report'
+REPORT_NAME = 'report.html'
+FIGURE_DIR = 'figures'
+FORMATS = ('png', 'svg')
+
+# (title, notebook cell, method of TripAggregates) of every insight table, in notebook order.
+INSIGHT_TABLES = [
+    ('Trips by User Type', 20, lambda aggregates: aggregates.trips_by_usertype().to_frame()),
+    ('Trips by Gender', 21, lambda aggregates: aggregates.trips_by_gender().to_frame()),
+    ('Mean Trip Duration (seconds) by User Type', 26, lambda aggregates: aggregates.mean_trip_duration().to_frame()),
+    ('Trips by Day of the Week and User Type', 30, lambda aggregates: aggregates.trips_by_day_usertype()),
+    ('Most Popular Start Stations by User Type', 32, lambda aggregates: aggregates.popular_start_stations(10)),
+    ('Most Popular End Stations by User Type', 33, lambda aggregates: aggregates.popular_end_stations(10)),
+    ('Trips without a Birthyear (%) by User Type', 34,
+     lambda aggregates: aggregates.unknown_birthyear_percentages().to_frame()),
+    ('Gender Distribution (%) by User Type', 39, lambda aggregates: aggregates.gender_user_type()),
+]
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em auto; max-width: 70em; }}
+figure {{ margin: 2em 0; }}
+img {{ max-width: 100%; }}
+table {{ border-collapse: collapse; margin: 1em 0 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 0.2em 0.6em; text-align: right; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>{summary}</p>
+<h2>Insights</h2>
+{tables}
+<h2>Figures</h2>
+{figures}
+</body>
+</html>
+"""
+
+
+def render_figure(name, tables, figure_dir, formats):
+    """Draw one figure of figures.FIGURES on the Agg backend and save it in every format.
+
+    Runs in a worker process; returns (name, paths, seconds).
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from cyclistic.figures import FIGURES
+
+    start = time.perf_counter()
+    draw = {figure_name: func for figure_name, _, func in FIGURES}[name]
+    fig = draw(tables)
+    paths = []
+    for fmt in formats:
+        path = os.path.join(figure_dir, f'{name}.{fmt}')
+        fig.savefig(path, bbox_inches='tight')
+        paths.append(path)
+    plt.close(fig)
+    return name, paths, time.perf_counter() - start
+
+
+def render_figures(tables, figure_dir, formats=FORMATS, workers=None):
+    """Render every figure into `figure_dir` in parallel; returns {name: [paths]} in notebook order."""
+    from cyclistic.figures import FIGURES
+
+    os.makedirs(figure_dir, exist_ok=True)
+    tasks = [(name, tables, figure_dir, formats) for name, _, _ in FIGURES]
+    return {name: paths for name, paths, _ in run_tasks(render_figure, tasks, workers)}
+
+
+def insight_tables(aggregates):
+    """The insight tables as (title, cell, DataFrame)."""
+    return [(title, cell, table(aggregates)) for title, cell, table in INSIGHT_TABLES]
+
+
+def table_html(title, cell, table):
+    body = table.to_html(float_format=lambda value: f'{value:,.2f}', border=0)
+    return f'<h3>{html.escape(title)} <small>(cell {cell})</small></h3>\n{body}'
+
+
+def image_src(path, report_dir, embed):
+    if not embed:
+        return os.path.relpath(path, report_dir).replace(os.sep, '/')
+    mime = 'image/svg+xml' if path.endswith('.svg') else 'image/png'
+    with open(path, 'rb') as f:
+        return f'data:{mime};base64,' + base64.b64encode(f.read()).decode('ascii')
+
+
+def figure_html(name, cell, paths, report_dir, embed):
+    # the first format is shown, the others are linked
+    src = image_src(paths[0], report_dir, embed)
+    links = ' '.join(f'<a href="{os.path.relpath(path, report_dir)}">{os.path.splitext(path)[1][1:]}</a>'
+                     for path in paths)
+    return (f'<figure><img src="{src}" alt="{name}">\n'
+            f'<figcaption>{name} (cell {cell}) {links}</figcaption></figure>')
+
+
+def write_report(aggregates, histograms, report_dir=REPORT_DIR, formats=FORMATS, workers=None, embed=True,
+                 title='Cyclistic Bike-Share Analysis', run=None):
+    """Render the figures and write report.html into `report_dir`; returns the report's path.
+
+    `histograms` is the {'tripduration', 'age'} output of density.build_histograms() (or
+    pipeline.ingest()). With embed=True the images are inlined so the HTML file stands on
+    its own; the image files are kept next to it either way.
+    """
+    from cyclistic.figures import FIGURES, figure_tables
+
+    with stage(run, 'tables'):
+        tables = figure_tables(aggregates, histograms)
+    with stage(run, 'render'):
+        paths = render_figures(tables, os.path.join(report_dir, FIGURE_DIR), formats, workers)
+
+    with stage(run, 'report'):
+        trips = int(aggregates.trips_by_usertype().sum())
+        page = PAGE.format(
+            title=html.escape(title),
+            summary=f'{trips:,} trips, generated {time.strftime("%Y-%m-%d %H:%M")}.',
+            tables='\n'.join(table_html(*table) for table in insight_tables(aggregates)),
+            figures='\n'.join(figure_html(name, cell, paths[name], report_dir, embed) for name, cell, _ in FIGURES),
+        )
+        path = os.path.join(report_dir, REPORT_NAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(page)
+    return path
+
+
+def build_report(paths, report_dir=REPORT_DIR, formats=FORMATS, workers=None, hooks=None, **kwargs):
+    """Aggregate the quarterly files and write the HTML report; returns (report path, run report)."""
+    from cyclistic.instrument import Run
+    from cyclistic.pipeline import ingest
+
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    run = Run(hooks, sources=[os.path.abspath(path) for path in paths])
+    aggregates, histograms = ingest(paths, run)
+    if aggregates is None:
+        raise ValueError('No trips were read from ' + ', '.join(map(str, paths)))
+    path = write_report(aggregates, histograms, report_dir, formats, workers, run=run, **kwargs)
+    return path, run.finish()
@@ -0,0 +1,107 @@
+# Compact, enforced dtype schema for the cleaned trips frame.
+#
+# After cleaning, the text columns are Python-object strings, the ids are int64 and
+# 'birthyear' is float64. The schema below stores text columns as categoricals and numbers
+# in the smallest widths that fit the Divvy data, which makes the frame several times smaller.
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+USERTYPES = ['Customer', 'Subscriber']
+GENDERS = ['Male', 'Female', 'Unknown']
+DAYS_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# The integer widths are fixed for the ranges of the Divvy ids rather than inferred from each
+# file, so every chunk and every quarter gets the same dtypes (and concatenates without
+# upcasting): trip ids are in the tens of millions, bike ids and station ids below 10,000.
+# apply_trip_schema checks each column with check_fits before casting, so ids that outgrow
+# these widths raise ValueError instead of wrapping around.
+TRIP_SCHEMA = {
+    'trip_id': 'int32',
+    'bikeid': 'int16',
+    # Durations keep float64: float32 rounds the fractional seconds of long trips, and can
+    # not hold every whole second beyond ~194 days.
+    'tripduration': 'float64',
+    'from_station_id': 'int16',
+    'from_station_name': 'category',
+    'to_station_id': 'int16',
+    'to_station_name': 'category',
+    'usertype': pd.CategoricalDtype(USERTYPES),
+    'gender': pd.CategoricalDtype(GENDERS),
+    'birthyear': 'Int16',
+}
+
+# Columns derived from the trips by cyclistic.features.add_features.
+FEATURE_SCHEMA = {
+    'start_hour': 'Int8',
+    'day_of_week': pd.CategoricalDtype(DAYS_ORDER, ordered=True),
+    'age': 'Int16',
+}
+
+
+def memory_usage_mb(df):
+    """Return the deep memory usage of a frame in MiB."""
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def check_fits(series, dtype):
+    """Raise ValueError if `series` holds values the schema dtype cannot represent."""
+    dtype = pd.api.types.pandas_dtype(dtype)
+    name = series.name
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        if dtype.categories is None:
+            return
+        unknown = set(series.dropna().unique()) - set(dtype.categories)
+        if unknown:
+            raise ValueError(f"Column '{name}' has values outside the schema: {sorted(unknown)}")
+        return
+
+    if dtype.kind in 'iu' and len(series):
+        limits = np.iinfo(dtype.numpy_dtype if hasattr(dtype, 'numpy_dtype') else dtype)
+        low, high = series.min(), series.max()
+        if pd.notna(low) and (low < limits.min or high > limits.max):
+            raise ValueError(f"Column '{name}' range [{low}, {high}] does not fit in {dtype}")
+
+
+def apply_trip_schema(df, report=False):
+    """Cast the cleaned trips columns to TRIP_SCHEMA and FEATURE_SCHEMA (columns not in the frame are skipped).
+
+    Values that do not fit the schema raise ValueError instead of being silently truncated.
+    With report=True the memory usage before and after is printed.
+    """
+    if report:
+        before = memory_usage_mb(df)
+
+    for col, dtype in dict(TRIP_SCHEMA, **FEATURE_SCHEMA).items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        check_fits(df[col], dtype)
+        df[col] = df[col].astype(dtype)
+
+    if report:
+        after = memory_usage_mb(df)
+        print(f'Memory usage: {before:.1f} MB -> {after:.1f} MB ({before / after:.1f}x smaller)')
+    return df
+
+
+def concat_trips(frames):
+    """Concatenate trip frames, keeping categorical columns categorical.
+
+    pd.concat falls back to object dtype when the chunks have different categories (e.g.
+    different station names), so those columns are merged with union_categoricals.
+    """
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame(columns=list(TRIP_SCHEMA)).pipe(apply_trip_schema)
+
+    categorical = [
+        col for col, dtype in frames[0].dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype) and any(f[col].dtype != dtype for f in frames[1:])
+    ]
+    df = pd.concat([f.drop(columns=categorical) for f in frames], ignore_index=True)
+    for col in categorical:
+        df[col] = union_categoricals([f[col] for f in frames], sort_categories=True).astype('category')
+    return df[frames[0].columns]
@@ -0,0 +1,161 @@
+# Scoring station-hours as targets for Customer-to-Subscriber conversion campaigns.
+#
+# The recommendations target Customers by station, hour, weekday and age. Here trips are
+# counted into a dense cube per (start station, hour of day, weekend, usertype, age band),
+# with the trip durations, in one np.bincount pass per chunk; cubes of chunks or quarters
+# are merged by adding them. Every (station, hour) cell then gets a vector of Customer
+# features, and the cells are ranked by a weighted sum of the standardized features:
+#
+#   customer_trips   number of Customer trips (log scale)       -- reach of a campaign
+#   customer_share   Customer trips / all trips                 -- share of the audience to convert
+#   weekend_share    share of Customer trips on Saturday/Sunday -- weekend advertising
+#   mean_duration    mean Customer trip duration (seconds)      -- longer trips gain most from subscribing
+#   young_share      share of Customers (with a birthyear) under 30
+#
+# Scoring is a matrix product over all cells, so millions of cells are ranked in seconds.
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.aggregate import DURATION_RANGE, category_codes
+from cyclistic.features import REFERENCE_DATE, ages
+from cyclistic.odmatrix import collect_station_names
+from cyclistic.schema import USERTYPES
+
+
+# Age bands: unknown birthyear, then [0, 30), [30, 45), [45, inf).
+AGE_EDGES = [30, 45]
+N_AGE_BANDS = len(AGE_EDGES) + 2
+
+CUSTOMER = USERTYPES.index('Customer')
+
+# Weight of every standardized feature in the score.
+SCORE_WEIGHTS = {
+    'customer_trips': 1.0,
+    'customer_share': 1.0,
+    'weekend_share': 0.5,
+    'mean_duration': 0.5,
+    'young_share': 0.5,
+}
+
+# Cells with fewer Customer trips are not ranked (their shares are too noisy).
+MIN_CUSTOMER_TRIPS = 20
+
+MEASURES = ['trips', 'duration_count', 'duration_sum']
+
+
+class ConversionCube:
+    """Trips and in-range durations per (station id, hour, weekend, usertype, age band)."""
+
+    def __init__(self, measures, station_names=None):
+        self.measures = measures
+        self.station_names = station_names or {}
+
+    @property
+    def n_stations(self):
+        return self.measures['trips'].shape[0]
+
+    @classmethod
+    def from_trips(cls, df, reference_date=REFERENCE_DATE):
+        """Build the cube from a frame of cleaned trips in one pass."""
+        start_time = df['start_time']
+        usertype = category_codes(df['usertype'], USERTYPES).astype(np.int64)
+        station = df['from_station_id'].to_numpy(dtype=np.int64)
+        valid = start_time.notna().to_numpy() & (usertype >= 0) & (station >= 0)
+
+        hour = start_time.dt.hour.fillna(0).to_numpy(dtype=np.int64)
+        weekend = (start_time.dt.dayofweek >= 5).to_numpy(dtype=np.int64)
+        age = (df['age'] if 'age' in df.columns else ages(df['birthyear'], reference_date)).astype('float64')
+        age_band = np.where(age.isna(), 0, np.searchsorted(AGE_EDGES, age.fillna(0), side='right') + 1)
+
+        n_stations = int(station.max(initial=-1)) + 1
+        shape = (n_stations, 24, 2, len(USERTYPES), N_AGE_BANDS)
+        key = np.ravel_multi_index(
+            (station[valid], hour[valid], weekend[valid], usertype[valid], age_band[valid]), shape)
+        size = int(np.prod(shape))
+
+        duration = df['tripduration'].to_numpy(dtype=np.float64)[valid]
+        low, high = DURATION_RANGE
+        in_range = (duration > low) & (duration < high)
+        measures = {
+            'trips': np.bincount(key, minlength=size).reshape(shape),
+            'duration_count': np.bincount(key, weights=in_range, minlength=size).reshape(shape),
+            'duration_sum': np.bincount(key, weights=np.where(in_range, duration, 0), minlength=size).reshape(shape),
+        }
+        return cls(measures, collect_station_names(df))
+
+    def merge(self, other):
+        n_stations = max(self.n_stations, other.n_stations)
+        measures = {}
+        for name in MEASURES:
+            total = np.zeros((n_stations,) + self.measures[name].shape[1:], dtype=self.measures[name].dtype)
+            total[:self.n_stations] += self.measures[name]
+            total[:other.n_stations] += other.measures[name]
+            measures[name] = total
+        return ConversionCube(measures, {**other.station_names, **self.station_names})
+
+    def cell_features(self):
+        """One row of Customer features per (station, hour) cell with trips."""
+        trips = self.measures['trips']
+        customer = trips[:, :, :, CUSTOMER, :]
+        customer_trips = customer.sum(axis=(2, 3))
+        all_trips = trips.sum(axis=(2, 3, 4))
+        weekend_trips = customer[:, :, 1, :].sum(axis=2)
+        known_age = customer[:, :, :, 1:].sum(axis=(2, 3))
+        young = customer[:, :, :, 1].sum(axis=2)
+        duration_count = self.measures['duration_count'][:, :, :, CUSTOMER, :].sum(axis=(2, 3))
+        duration_sum = self.measures['duration_sum'][:, :, :, CUSTOMER, :].sum(axis=(2, 3))
+
+        stations, hours = np.nonzero(all_trips)
+        cell = (stations, hours)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.DataFrame({
+                'from_station_id': stations,
+                'from_station_name': [self.station_names.get(int(s)) for s in stations],
+                'hour': hours,
+                'trips': all_trips[cell],
+                'customer_trips': customer_trips[cell],
+                'customer_share': customer_trips[cell] / all_trips[cell],
+                'weekend_share': weekend_trips[cell] / customer_trips[cell],
+                'mean_duration': duration_sum[cell] / duration_count[cell],
+                'young_share': young[cell] / known_age[cell],
+            })
+
+
+def score_features(features, weights=SCORE_WEIGHTS, min_customer_trips=MIN_CUSTOMER_TRIPS):
+    """Add a 'score' and 'rank' to the cells with at least `min_customer_trips` Customer trips."""
+    cells = features[features['customer_trips'] >= min_customer_trips].copy()
+    columns = list(weights)
+    values = cells[columns].to_numpy(dtype=np.float64)
+    values[:, columns.index('customer_trips')] = np.log1p(values[:, columns.index('customer_trips')])
+
+    # standardize every feature over the ranked cells; a missing share counts as average
+    mean = np.nanmean(values, axis=0)
+    std = np.nanstd(values, axis=0)
+    z = np.nan_to_num((values - mean) / np.where(std > 0, std, 1), nan=0.0)
+    cells['score'] = z @ np.asarray([weights[c] for c in columns])
+
+    cells = cells.sort_values('score', ascending=False, kind='stable')
+    cells.insert(0, 'rank', np.arange(1, len(cells) + 1))
+    return cells.reset_index(drop=True)
+
+
+def conversion_cube(df, reference_date=REFERENCE_DATE):
+    return ConversionCube.from_trips(df, reference_date)
+
+
+def cube_chunks(chunks, reference_date=REFERENCE_DATE):
+    """Build a ConversionCube from an iterable of cleaned trip chunks (e.g. iter_trip_chunks)."""
+    cube = None
+    for chunk in chunks:
+        partial = conversion_cube(chunk, reference_date)
+        cube = partial if cube is None else cube.merge(partial)
+    return cube
+
+
+def campaign_targets(cube, n=100, path=None, weights=SCORE_WEIGHTS, min_customer_trips=MIN_CUSTOMER_TRIPS):
+    """The `n` best station-hours to target, written to `path` (CSV) when given."""
+    targets = score_features(cube.cell_features(), weights, min_customer_trips).head(n)
+    if path:
+        targets.to_csv(path, index=False, float_format='%.4f')
+    return targets
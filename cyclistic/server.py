@@ -0,0 +1,281 @@
+# Local HTTP service answering parameterized questions about the trips as JSON.
+#
+# The column store (cyclistic.columnstore) is opened once at startup; a query selects its
+# trips through the store's indexes (user type, start station, dates) and computes one
+# metric from the few columns it needs. Results are kept in an LRU cache bounded by the
+# size of their JSON bodies, so repeated questions are answered without touching the trips.
+#
+#   GET /query?metric=hourly_profile&usertype=Customer&station=Shedd Aquarium&start=2019-06-01&end=2019-06-30
+#   GET /metrics     the available metrics
+#   GET /stats       cache hits, misses and size
+#
+# The server is a plain asyncio stream server speaking HTTP/1.1 with keep-alive; cache misses
+# are computed in a thread so the event loop keeps accepting requests.
+
+import asyncio
+import collections
+import json
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.aggregate import DURATION_RANGE
+from cyclistic.columnstore import STORE_DIR, ColumnStore, missing_value
+from cyclistic.schema import DAYS_ORDER, USERTYPES
+
+
+HOST = '127.0.0.1'
+PORT = 8050
+
+# Largest total size (bytes of JSON) of the cached results.
+CACHE_BYTES = 64 * 1024 * 1024
+
+QUERY_PARAMETERS = ['metric', 'usertype', 'station', 'start', 'end']
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+
+class QueryError(ValueError):
+    """A query with missing or invalid parameters (answered with status 400)."""
+
+
+class ResultCache:
+    """Least recently used cache of JSON bodies, evicted when their total size exceeds max_bytes."""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        body = self.entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+# Metrics: compute the result from the store and the rows of the selected trips.
+
+def trips(store, rows):
+    return {'trips': len(rows)}
+
+
+def hourly_profile(store, rows):
+    hours = np.asarray(store.column('start_hour')[rows]).astype(np.int64)
+    counts = np.bincount(hours[hours != missing_value('start_hour')], minlength=24)
+    return {'hour': list(range(24)), 'trips': counts.tolist()}
+
+
+def day_of_week(store, rows):
+    days = np.asarray(store.column('day_of_week')[rows]).astype(np.int64)
+    counts = np.bincount(days[days >= 0], minlength=len(DAYS_ORDER))
+    return {'day_of_week': DAYS_ORDER, 'trips': counts.tolist()}
+
+
+def daily_trips(store, rows):
+    dates = np.asarray(store.column('start_time')[rows]).astype('datetime64[D]')
+    days, counts = np.unique(dates[~np.isnat(dates)], return_counts=True)
+    return {'date': days.astype(str).tolist(), 'trips': counts.tolist()}
+
+
+def mean_duration(store, rows):
+    duration = np.asarray(store.column('tripduration')[rows]).astype(np.float64)
+    low, high = DURATION_RANGE
+    duration = duration[(duration > low) & (duration < high)]
+    return {'mean_tripduration': float(duration.mean()) if len(duration) else None, 'trips': len(duration)}
+
+
+def top_end_stations(store, rows, n=10):
+    codes = np.asarray(store.column('to_station_name')[rows]).astype(np.int64)
+    codes, counts = np.unique(codes[codes >= 0], return_counts=True)
+    top = np.argsort(-counts, kind='stable')[:n]
+    names = store.dictionary('to_station_name')
+    return {'station': [names[code] for code in codes[top]], 'trips': counts[top].tolist()}
+
+
+METRICS = {
+    'trips': trips,
+    'hourly_profile': hourly_profile,
+    'day_of_week': day_of_week,
+    'daily_trips': daily_trips,
+    'mean_duration': mean_duration,
+    'top_end_stations': top_end_stations,
+}
+
+
+def query_conditions(store, params):
+    """Column store conditions (see ColumnStore.rows) of the query parameters."""
+    conditions = {}
+    usertype = params.get('usertype')
+    if usertype:
+        if usertype not in USERTYPES:
+            raise QueryError(f'unknown usertype {usertype!r}, expected one of {USERTYPES}')
+        conditions['usertype'] = usertype
+
+    station = params.get('station')
+    if station:
+        if station.isdigit():
+            limits = np.iinfo(store.meta['dtypes']['from_station_id'])
+            if not limits.min <= int(station) <= limits.max:
+                raise QueryError(f'no start station has id {station}')
+            conditions['from_station_id'] = int(station)
+        else:
+            names = [name for name in store.dictionary('from_station_name') if station.lower() in name.lower()]
+            if not names:
+                raise QueryError(f'no start station matches {station!r}')
+            conditions['from_station_name'] = names
+
+    start, end = params.get('start'), params.get('end')
+    if start or end:
+        try:
+            first = pd.Timestamp(start if start else store.keys('start_date').min())
+            last = pd.Timestamp(end if end else store.keys('start_date').max())
+        except ValueError as e:
+            raise QueryError(f'invalid date: {e}') from None
+        if first > last:
+            raise QueryError(f'start {first:%Y-%m-%d} is after end {last:%Y-%m-%d}')
+        conditions['start_date'] = pd.date_range(first, last, freq='D').strftime('%Y-%m-%d').tolist()
+    return conditions
+
+
+def run_query(store, params):
+    """Answer a query (a dict of QUERY_PARAMETERS) as a JSON-serializable dict."""
+    metric = params.get('metric', 'trips')
+    if metric not in METRICS:
+        raise QueryError(f'unknown metric {metric!r}, expected one of {sorted(METRICS)}')
+    rows = store.rows(**query_conditions(store, params))
+    return dict(query=params, **METRICS[metric](store, rows))
+
+
+def cache_key(params):
+    return tuple(sorted(params.items()))
+
+
+class QueryService:
+    """The store and result cache behind the HTTP server."""
+
+    def __init__(self, store_dir=STORE_DIR, cache_bytes=CACHE_BYTES):
+        self.store = ColumnStore(store_dir)
+        self.cache = ResultCache(cache_bytes)
+        # open the memory maps and indexes once, before queries share them across threads
+        for column in self.store.columns:
+            self.store.column(column)
+        for column in self.store.indexes.meta:
+            self.store.indexes.index(column)
+
+    async def query(self, params):
+        """JSON body of a query, from the cache or computed in a worker thread."""
+        key = cache_key(params)
+        body = self.cache.get(key)
+        if body is None:
+            result = await asyncio.get_running_loop().run_in_executor(None, run_query, self.store, params)
+            body = json.dumps(result).encode()
+            self.cache.put(key, body)
+        return body
+
+    async def respond(self, method, target):
+        """(status, JSON body) of a request; an unexpected error is answered with status 500."""
+        try:
+            return await self.route(method, target)
+        except Exception as e:
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+    async def route(self, method, target):
+        if method != 'GET':
+            return 405, {'error': 'only GET is supported'}
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if url.path == '/query':
+            unknown = set(params) - set(QUERY_PARAMETERS)
+            if unknown:
+                return 400, {'error': f'unknown parameters {sorted(unknown)}, expected {QUERY_PARAMETERS}'}
+            try:
+                return 200, await self.query(params)
+            except QueryError as e:
+                return 400, {'error': str(e)}
+        if url.path == '/metrics':
+            return 200, {'metrics': sorted(METRICS)}
+        if url.path == '/stats':
+            return 200, dict(self.cache.stats(), rows=len(self.store))
+        return 404, {'error': f'no such path {url.path!r}'}
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+
+                status, body = await self.respond(method, target)
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+                writer.write(
+                    f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(body)}\r\n'
+                    f'Connection: {"close" if close else "keep-alive"}\r\n\r\n'.encode('latin-1') + body
+                )
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def start_server(store_dir=STORE_DIR, host=HOST, port=PORT, cache_bytes=CACHE_BYTES):
+    service = QueryService(store_dir, cache_bytes)
+    server = await asyncio.start_server(service.handle, host, port)
+    return service, server
+
+
+def serve(store_dir=STORE_DIR, host=HOST, port=PORT, cache_bytes=CACHE_BYTES):
+    """Run the query service until interrupted."""
+    async def main():
+        _, server = await start_server(store_dir, host, port, cache_bytes)
+        print(f'Serving {store_dir} on http://{host}:{port}/query')
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,112 @@
+# Append-only store of per-quarter aggregates.
+#
+# Refreshing the tables behind hourly_counts, trips_by_day_usertype, popular_start_stations
+# and the mean-duration tables used to mean re-running everything over all history. The
+# store keeps the TripAggregates of every quarterly file on disk as mergeable sums and
+# counts (<store_dir>/<source>/*.parquet); ingesting a new quarter only aggregates that
+# file, and the full-history tables are the merge of all stored partials.
+
+import os
+import shutil
+
+import pandas as pd
+
+from cyclistic.aggregate import TripAggregates, aggregate_chunks
+from cyclistic.cache import is_cached, read_manifest, renamed_sources, source_entry, source_name, write_manifest
+from cyclistic.loader import CHUNK_SIZE, iter_trip_chunks
+
+
+STORE_DIR = 'trip_aggregates'
+
+# Tables compared by verify_store, i.e. everything the notebook plots from the aggregates.
+TABLES = [
+    'mean_trip_duration',
+    'mean_tripduration_by_day_usertype',
+    'hourly_counts',
+    'trips_by_day_usertype',
+    'popular_start_stations',
+    'popular_end_stations',
+    'unknown_birthyear_percentages',
+    'gender_user_type',
+]
+
+
+def save_aggregates(aggregates, directory):
+    """Write the cubes of a TripAggregates to Parquet files in `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    aggregates.activity.to_parquet(os.path.join(directory, 'activity.parquet'))
+    aggregates.start_stations.to_frame().to_parquet(os.path.join(directory, 'start_stations.parquet'))
+    aggregates.end_stations.to_frame().to_parquet(os.path.join(directory, 'end_stations.parquet'))
+
+
+def read_aggregates(directory):
+    """Read a TripAggregates written by save_aggregates."""
+    return TripAggregates(
+        pd.read_parquet(os.path.join(directory, 'activity.parquet')),
+        pd.read_parquet(os.path.join(directory, 'start_stations.parquet'))['trips'],
+        pd.read_parquet(os.path.join(directory, 'end_stations.parquet'))['trips'],
+    )
+
+
+def ingest_quarter(path, store_dir=STORE_DIR, chunksize=CHUNK_SIZE):
+    """Aggregate one quarterly file into the store, unless its current version is already there.
+
+    Returns True if the file was (re)aggregated. A changed file replaces its old partial.
+    """
+    if is_cached(path, store_dir):
+        return False
+
+    name = source_name(path)
+    partial_dir = os.path.join(store_dir, name)
+    tmp_dir = partial_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    save_aggregates(aggregate_chunks(iter_trip_chunks(path, chunksize=chunksize)), tmp_dir)
+
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.replace(tmp_dir, partial_dir)
+
+    manifest = read_manifest(store_dir)
+    for other in renamed_sources(path, manifest):
+        del manifest[other]
+        shutil.rmtree(os.path.join(store_dir, other), ignore_errors=True)
+    manifest[name] = source_entry(path)
+    write_manifest(manifest, store_dir)
+    return True
+
+
+def ingest(paths, store_dir=STORE_DIR, chunksize=CHUNK_SIZE):
+    """Ingest every new or changed quarterly file; returns the files that were aggregated."""
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    return [path for path in paths if ingest_quarter(path, store_dir, chunksize)]
+
+
+def load_store(store_dir=STORE_DIR, sources=None):
+    """Merge the stored partials (all of them, or only the given source names) into one TripAggregates."""
+    names = sorted(read_manifest(store_dir)) if sources is None else sources
+    aggregates = None
+    for name in names:
+        partial = read_aggregates(os.path.join(store_dir, name))
+        aggregates = partial if aggregates is None else aggregates.merge(partial)
+    return aggregates
+
+
+def verify_store(paths, store_dir=STORE_DIR, chunksize=CHUNK_SIZE):
+    """Check the merged store against a full recompute over `paths`.
+
+    Every table in TABLES is rebuilt from the raw files and compared with the one served by
+    the store (sums may differ in the last bits because they are added in another order).
+    Raises AssertionError on the first mismatch.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    stored = load_store(store_dir, sources=[source_name(path) for path in paths])
+    full = aggregate_chunks(iter_trip_chunks(paths, chunksize=chunksize))
+
+    for table in TABLES:
+        expected, result = getattr(full, table)(), getattr(stored, table)()
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), obj=table)
+        else:
+            pd.testing.assert_series_equal(result, expected, obj=table)
@@ -0,0 +1,126 @@
+# Seeded generator of synthetic Divvy-shaped trip files.
+#
+# The real quarterly CSVs are not part of the repository, so benchmarks run on synthetic
+# trips with the same schema and the same quirks: 'tripduration' formatted with ','
+# thousands separators, missing 'gender' and 'birthyear' at the rates seen in the 2019 data
+# (mostly for Customers), and ~600 stations whose popularity follows a Zipf-like law.
+
+import numpy as np
+import pandas as pd
+
+
+N_STATIONS = 600
+N_BIKES = 6000
+FIRST_TRIP_ID = 21_742_443
+
+# Shares observed in Divvy_Trips_2019_Q1.
+CUSTOMER_SHARE = 0.063
+MISSING_GENDER = {'Customer': 0.61, 'Subscriber': 0.015}
+MISSING_BIRTHYEAR = {'Customer': 0.75, 'Subscriber': 0.003}
+FEMALE_SHARE = 0.2
+STATION_ZIPF_EXPONENT = 0.6
+
+COLUMNS = [
+    'trip_id', 'start_time', 'end_time', 'bikeid', 'tripduration', 'from_station_id', 'from_station_name',
+    'to_station_id', 'to_station_name', 'usertype', 'gender', 'birthyear',
+]
+
+
+def station_names(n=N_STATIONS):
+    streets = ['Clark St', 'State St', 'Halsted St', 'Ashland Ave', 'Damen Ave', 'Western Ave', 'Canal St', 'Wells St']
+    cross = ['Madison St', 'Lake St', 'Division St', 'Chicago Ave', 'Grand Ave', 'Roosevelt Rd', 'Fullerton Ave']
+    return np.array([f'{streets[i % len(streets)]} & {cross[i // len(streets) % len(cross)]} ({i})' for i in range(n)])
+
+
+def station_weights(n=N_STATIONS, exponent=STATION_ZIPF_EXPONENT):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def format_durations(seconds):
+    """Format durations like the Divvy files: '390.0', '1,783.0'."""
+    return pd.Series(seconds.astype(np.int64)).map('{:,}.0'.format).to_numpy()
+
+
+def format_times(times):
+    """Format datetime64 values as 'YYYY-MM-DD HH:MM:SS' (much faster than strftime)."""
+    return np.char.replace(np.datetime_as_string(np.asarray(times, dtype='datetime64[s]'), unit='s'), 'T', ' ')
+
+
+def generate_trips(n, start='2019-01-01', days=90, seed=0, first_trip_id=FIRST_TRIP_ID):
+    """Return a frame of `n` raw (uncleaned) synthetic trips starting on `start`, sorted by start time."""
+    rng = np.random.default_rng(seed)
+    names = station_names()
+    weights = station_weights()
+
+    usertype = np.where(rng.random(n) < CUSTOMER_SHARE, 'Customer', 'Subscriber')
+    customer = usertype == 'Customer'
+
+    # Commute peaks for Subscribers, an afternoon peak for Customers.
+    day = rng.integers(0, days, n)
+    hour = np.where(
+        customer, rng.normal(15, 3, n),
+        np.where(rng.random(n) < 0.5, rng.normal(8.5, 1.5, n), rng.normal(17.5, 1.5, n)),
+    ) % 24
+    offsets = day * 86400 + (hour * 3600).astype(np.int64)
+    # sort the trips by start time, keeping every start time with its trip's user type
+    order = np.argsort(offsets, kind='stable')
+    offsets, usertype, customer = offsets[order], usertype[order], customer[order]
+    start_time = pd.Timestamp(start) + pd.to_timedelta(offsets, unit='s')
+
+    duration = np.round(rng.lognormal(np.where(customer, 7.2, 6.3), 0.8, n)) + 61
+    end_time = start_time + pd.to_timedelta(duration, unit='s')
+
+    from_station = rng.choice(len(names), size=n, p=weights)
+    to_station = np.where(rng.random(n) < 0.3, from_station, rng.choice(len(names), size=n, p=weights))
+
+    gender = np.where(rng.random(n) < FEMALE_SHARE, 'Female', 'Male').astype(object)
+    birthyear = np.where(customer, rng.normal(1988, 10, n), rng.normal(1981, 11, n)).round().clip(1900, 2003)
+    missing = rng.random(n)
+    for kind, rate in MISSING_GENDER.items():
+        gender[(usertype == kind) & (missing < rate)] = np.nan
+    missing = rng.random(n)
+    for kind, rate in MISSING_BIRTHYEAR.items():
+        birthyear[(usertype == kind) & (missing < rate)] = np.nan
+
+    return pd.DataFrame({
+        'trip_id': np.arange(first_trip_id, first_trip_id + n),
+        'start_time': format_times(start_time),
+        'end_time': format_times(end_time),
+        'bikeid': rng.integers(1, N_BIKES + 1, n),
+        'tripduration': format_durations(duration),
+        'from_station_id': from_station + 2,
+        'from_station_name': names[from_station],
+        'to_station_id': to_station + 2,
+        'to_station_name': names[to_station],
+        'usertype': usertype,
+        'gender': gender,
+        'birthyear': birthyear,
+    }, columns=COLUMNS)
+
+
+def write_trips_csv(path, n, seed=0, chunksize=1_000_000, start='2019-01-01', days=90):
+    """Write `n` synthetic trips to a CSV file in chunks, so any size can be generated.
+
+    The trips are spread evenly over the `days`, and every chunk covers its own consecutive
+    days (as many as fit in `chunksize` trips, at least one), so the file is sorted by start
+    time like the Divvy files.
+    """
+    per_day = np.diff(np.linspace(0, n, days + 1).round().astype(np.int64))
+    written = 0
+    part = 0
+    day = 0
+    while day < days:
+        first, size = day, per_day[day]
+        day += 1
+        while day < days and size + per_day[day] <= chunksize:
+            size += per_day[day]
+            day += 1
+        if not size:
+            continue
+        chunk = generate_trips(size, start=pd.Timestamp(start) + pd.Timedelta(days=first), days=day - first,
+                               seed=seed + part, first_trip_id=FIRST_TRIP_ID + written)
+        chunk.to_csv(path, mode='w' if part == 0 else 'a', header=part == 0, index=False)
+        written += size
+        part += 1
+    return path
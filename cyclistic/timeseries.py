@@ -0,0 +1,165 @@
+# Hourly ride demand over the calendar timeline, per start station and usertype.
+#
+# Cell 19 counts trips per hour of the day, pooled over the whole quarter. Here trips are
+# streamed chunk by chunk into counts per (calendar hour, from_station_id, usertype): only the
+# combinations with trips are kept, as four small integer columns, so the counts of several
+# years stay compact and merge by adding. Resampled series, rolling windows, week-over-week
+# changes and seasonal profiles are then computed from the counts; hours without trips are
+# filled with zeros when a series is built, so every series covers the full timeline.
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.aggregate import category_codes
+from cyclistic.schema import DAYS_ORDER, USERTYPES
+
+
+# Station ids are int16, so (hour, station, usertype) packs into one int64 key.
+STATION_SLOTS = 1 << 16
+
+# The keys seasonal_profile groups the hours of the timeline by.
+PROFILES = {
+    'hour': ['hour'],
+    'day_of_week': ['day_of_week'],
+    'hour_of_week': ['day_of_week', 'hour'],
+    'month': ['month'],
+}
+
+
+def pack(hours, stations, usertypes):
+    return (hours * STATION_SLOTS + stations) * len(USERTYPES) + usertypes
+
+
+def combine(keys, counts):
+    """Sum the counts of equal keys; returns sorted unique keys and their totals."""
+    order = np.argsort(keys, kind='stable')
+    keys, counts = keys[order], counts[order]
+    unique, starts = np.unique(keys, return_index=True)
+    return unique, np.add.reduceat(counts, starts) if len(keys) else counts
+
+
+class DemandCounts:
+    """Trips per (calendar hour, from_station_id, usertype), for the combinations with trips.
+
+    `keys` pack hours since the epoch, the station id and the usertype code (see pack());
+    `trips` holds the count of each key.
+    """
+
+    def __init__(self, keys=None, trips=None):
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else keys
+        self.trips = np.zeros(0, dtype=np.int64) if trips is None else trips
+
+    @classmethod
+    def from_trips(cls, df):
+        """Count the trips of a cleaned frame."""
+        start_time = df['start_time']
+        usertype = category_codes(df['usertype'], USERTYPES).astype(np.int64)
+        valid = start_time.notna().to_numpy() & (usertype >= 0)
+        hours = start_time.to_numpy()[valid].astype('datetime64[h]').astype(np.int64)
+        stations = df['from_station_id'].to_numpy(dtype=np.int64)[valid]
+        keys, trips = combine(pack(hours, stations, usertype[valid]), np.ones(len(hours), dtype=np.int64))
+        return cls(keys, trips)
+
+    def merge(self, other):
+        return DemandCounts(*combine(np.concatenate([self.keys, other.keys]),
+                                     np.concatenate([self.trips, other.trips])))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def total(self):
+        return int(self.trips.sum())
+
+    def unpack(self):
+        """(hours since the epoch, station ids, usertype codes) of every key."""
+        rest, usertypes = np.divmod(self.keys, len(USERTYPES))
+        hours, stations = np.divmod(rest, STATION_SLOTS)
+        return hours, stations, usertypes
+
+    def to_frame(self):
+        hours, stations, usertypes = self.unpack()
+        return pd.DataFrame({
+            'hour': hours.astype('datetime64[h]').astype('datetime64[ns]'),
+            'from_station_id': stations.astype(np.int16),
+            'usertype': pd.Categorical.from_codes(usertypes, categories=USERTYPES),
+            'trips': self.trips.astype(np.int32),
+        })
+
+    def save(self, path):
+        """Write the counts to a Parquet file (about 7 bytes per non-empty hour)."""
+        hours, stations, usertypes = self.unpack()
+        pd.DataFrame({
+            'hour': hours.astype(np.int32),
+            'from_station_id': stations.astype(np.int16),
+            'usertype': usertypes.astype(np.int8),
+            'trips': self.trips.astype(np.int32),
+        }).to_parquet(path, index=False)
+
+    @classmethod
+    def read(cls, path):
+        frame = pd.read_parquet(path)
+        keys = pack(frame['hour'].to_numpy(dtype=np.int64), frame['from_station_id'].to_numpy(dtype=np.int64),
+                    frame['usertype'].to_numpy(dtype=np.int64))
+        return cls(keys, frame['trips'].to_numpy(dtype=np.int64))
+
+    def series(self, freq='h', stations=None, usertype=None, start=None, end=None):
+        """Trips per period of `freq` ('h', 'D', 'W', 'MS', ...) over the full timeline.
+
+        `stations` (one id or a list) and `usertype` restrict the trips counted; periods
+        without trips are 0. The timeline runs from the first to the last hour with trips,
+        or from `start` to `end`.
+        """
+        hours, station_ids, usertypes = self.unpack()
+        keep = np.ones(len(hours), dtype=bool)
+        if stations is not None:
+            keep &= np.isin(station_ids, np.atleast_1d(stations))
+        if usertype is not None:
+            keep &= usertypes == USERTYPES.index(usertype)
+
+        first = np.datetime64(start, 'h').astype(np.int64) if start is not None else hours.min() if len(hours) else 0
+        last = np.datetime64(end, 'h').astype(np.int64) if end is not None else hours.max() if len(hours) else -1
+        keep &= (hours >= first) & (hours <= last)
+        counts = np.bincount(hours[keep] - first, weights=self.trips[keep], minlength=max(last - first + 1, 0))
+        index = pd.date_range(pd.Timestamp(np.datetime64(int(first), 'h')), periods=len(counts), freq='h',
+                              name='hour')
+        hourly = pd.Series(counts.astype(np.int64), index=index, name='trips')
+        return hourly if freq == 'h' else hourly.resample(freq).sum()
+
+    def rolling_mean(self, window='7D', freq='D', **selection):
+        """Rolling mean of the trips per `freq` period over a time `window`."""
+        return self.series(freq, **selection).rolling(window).mean().rename('rolling_mean')
+
+    def week_over_week(self, freq='D', **selection):
+        """Trips per period next to the same period one week earlier, with the change in percent."""
+        current = self.series(freq, **selection)
+        previous = current.shift(freq='7D').reindex(current.index)
+        return pd.DataFrame({
+            'trips': current,
+            'previous_week': previous,
+            'change_percent': (current - previous) / previous.where(previous > 0) * 100,
+        })
+
+    def seasonal_profile(self, by='hour_of_week', **selection):
+        """Mean trips per hour for each hour of the day, day of the week, hour of the week or month."""
+        hourly = self.series('h', **selection)
+        index = hourly.index
+        keys = {
+            'hour': index.hour,
+            'day_of_week': pd.Categorical.from_codes(index.dayofweek, categories=DAYS_ORDER, ordered=True),
+            'month': index.month,
+        }
+        by_keys = [pd.Series(keys[name], index=index, name=name) for name in PROFILES[by]]
+        return hourly.groupby(by_keys, observed=True).mean().rename('mean_trips')
+
+
+def demand_counts(df):
+    return DemandCounts.from_trips(df)
+
+
+def demand_chunks(chunks):
+    """Count an iterable of cleaned trip chunks (e.g. iter_trip_chunks) into one DemandCounts."""
+    counts = DemandCounts()
+    for chunk in chunks:
+        counts = counts.merge(demand_counts(chunk))
+    return counts
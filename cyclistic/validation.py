@@ -0,0 +1,223 @@
+# Data-quality rules checked on every chunk during ingestion.
+#
+# The notebook checks the data with df.duplicated().sum() over all columns, isnull().sum()
+# and by looking at df.info() / df.head(50). Here the checks are declarative rules, each a
+# vectorized function returning a boolean mask of the failing rows of a cleaned chunk. Only
+# the counts are kept (the failing rows can optionally be written to a quarantine CSV, with
+# the names of the rules they failed). The chunks are cleaned with errors='coerce', so a
+# value that cannot be parsed, or does not fit the schema, fails a rule instead of stopping
+# the run. Duplicates are found on 'trip_id' alone, with blocks of flags keyed by the ids
+# seen so far, so they are detected across chunks and files.
+#
+# validate_files() evaluates the rules of every chunk in worker processes and combines the
+# results in order in this process, where the duplicate check and the quarantine file live.
+
+import collections
+import os
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.loader import CHUNK_SIZE, ID_COLUMNS, clean_trips, iter_raw_chunks
+from cyclistic.parallel import run_tasks
+from cyclistic.schema import TRIP_SCHEMA
+
+
+# A rider's age at the time of the trip must be within this range for the birthyear to be plausible.
+AGE_RANGE = (16, 90)
+
+# Largest accepted difference (seconds) between 'tripduration' and end_time - start_time.
+DURATION_TOLERANCE = 2.0
+
+DUPLICATE_RULE = 'duplicate_trip_id'
+
+# Rules failed by rows that cannot be stored in TRIP_SCHEMA or have no usable times; the
+# pipeline drops these rows (see usable_rows) after counting them.
+UNUSABLE_RULES = ['unparsed_value', 'outside_schema']
+
+
+def unparsed_value(trips, known_stations):
+    columns = ID_COLUMNS + ['tripduration', 'start_time', 'end_time']
+    return trips[columns].isna().any(axis=1).to_numpy()
+
+
+def outside_schema(trips, known_stations):
+    outside = np.zeros(len(trips), dtype=bool)
+    for column, dtype in TRIP_SCHEMA.items():
+        dtype = pd.api.types.pandas_dtype(dtype)
+        values = trips[column]
+        if isinstance(dtype, pd.CategoricalDtype):
+            if dtype.categories is not None:
+                outside |= (values.notna() & ~values.isin(dtype.categories)).to_numpy()
+        elif dtype.kind in 'iu':
+            limits = np.iinfo(getattr(dtype, 'numpy_dtype', dtype))
+            values = values.astype('float64')
+            outside |= ((values < limits.min) | (values > limits.max)).to_numpy()
+    return outside
+
+
+def end_before_start(trips, known_stations):
+    return (trips['end_time'] < trips['start_time']).to_numpy()
+
+
+def duration_mismatch(trips, known_stations):
+    elapsed = (trips['end_time'] - trips['start_time']).dt.total_seconds()
+    difference = (trips['tripduration'].astype('float64') - elapsed).abs()
+    return (difference > DURATION_TOLERANCE).to_numpy()
+
+
+def implausible_birthyear(trips, known_stations):
+    age = trips['start_time'].dt.year - trips['birthyear'].astype('float64')
+    low, high = AGE_RANGE
+    return ((age < low) | (age > high)).to_numpy()
+
+
+def unknown_station(trips, known_stations):
+    unknown = np.zeros(len(trips), dtype=bool)
+    for column in ('from_station_id', 'to_station_id'):
+        ids = trips[column].astype('float64')
+        unknown |= (ids.isna() | (ids < 0)).to_numpy()
+        if known_stations is not None:
+            unknown |= ~ids.isin(known_stations).to_numpy()
+    return unknown
+
+
+# (name, description, function) of every per-row rule; DUPLICATE_RULE is checked across chunks.
+RULES = [
+    ('unparsed_value', 'tripduration, start_time, end_time or an id missing or not parseable', unparsed_value),
+    ('outside_schema', 'usertype or gender not a known category, or an id too large for its column',
+     outside_schema),
+    ('end_before_start', 'end_time is before start_time', end_before_start),
+    ('duration_mismatch', f'tripduration differs from end_time - start_time by more than {DURATION_TOLERANCE:g} s',
+     duration_mismatch),
+    ('implausible_birthyear', f'age at the time of the trip outside {AGE_RANGE[0]}-{AGE_RANGE[1]}',
+     implausible_birthyear),
+    ('unknown_station', 'from/to station id missing, negative or not a known station', unknown_station),
+]
+RULE_DESCRIPTIONS = dict([(name, description) for name, description, _ in RULES],
+                         **{DUPLICATE_RULE: 'trip_id already seen in an earlier row'})
+
+
+def evaluate_rules(trips, known_stations=None):
+    """Boolean (rows x rules) array of the RULES failed by each row of a cleaned chunk."""
+    if not len(trips):
+        return np.zeros((0, len(RULES)), dtype=bool)
+    return np.column_stack([rule(trips, known_stations) for _, _, rule in RULES])
+
+
+def usable_rows(trips):
+    """Mask of the rows of a chunk cleaned with errors='coerce' that fail none of UNUSABLE_RULES."""
+    rules = dict((name, rule) for name, _, rule in RULES)
+    unusable = np.zeros(len(trips), dtype=bool)
+    for name in UNUSABLE_RULES:
+        unusable |= rules[name](trips, None)
+    return ~unusable
+
+
+class TripIdSet:
+    """The trip ids seen so far, as blocks of BLOCK_SIZE flags keyed by id // BLOCK_SIZE.
+
+    Divvy trip ids are dense integers, so a block covers many ids in little memory, and a
+    stray id far from the others only adds one block.
+    """
+
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self):
+        self.blocks = {}
+
+    def add(self, trip_ids):
+        """Add a batch of ids; return a mask of those already seen (earlier or within the batch).
+
+        Missing ids (NaN, from a chunk cleaned with errors='coerce') are skipped.
+        """
+        trip_ids = pd.Series(np.asarray(trip_ids))
+        present = trip_ids.notna().to_numpy()
+        seen = np.zeros(len(trip_ids), dtype=bool)
+        if not present.all():
+            seen[present] = self.add(trip_ids[present].to_numpy())
+            return seen
+        trip_ids = trip_ids.to_numpy(dtype=np.int64)
+        seen = pd.Series(trip_ids).duplicated().to_numpy()
+        block_numbers, offsets = np.divmod(trip_ids, self.BLOCK_SIZE)
+        order = np.argsort(block_numbers, kind='stable')
+        numbers, starts = np.unique(block_numbers[order], return_index=True)
+        for number, rows in zip(numbers, np.split(order, starts[1:])):
+            block = self.blocks.setdefault(int(number), np.zeros(self.BLOCK_SIZE, dtype=bool))
+            seen[rows] |= block[offsets[rows]]
+            block[offsets[rows]] = True
+        return seen
+
+
+class Validator:
+    """Counts of rule failures over a stream of chunks."""
+
+    def __init__(self, known_stations=None, quarantine=None):
+        self.known_stations = known_stations
+        self.quarantine = quarantine
+        self.rows = 0
+        self.failures = collections.Counter()
+        self.failed_rows = 0
+        self.trip_ids = TripIdSet()
+        if quarantine and os.path.exists(quarantine):
+            os.remove(quarantine)
+
+    def update(self, trips, raw=None):
+        """Check a cleaned chunk; failing rows of `raw` (or of `trips`) go to the quarantine file."""
+        return self.add_results(trips['trip_id'].to_numpy(), evaluate_rules(trips, self.known_stations),
+                                trips if raw is None else raw)
+
+    def add_results(self, trip_ids, flags, rows=None):
+        """Add the rule flags of a chunk evaluated elsewhere (e.g. in a worker process)."""
+        duplicate = self.trip_ids.add(trip_ids)
+        flags = np.column_stack([flags, duplicate])
+        self.rows += len(trip_ids)
+        names = [name for name, _, _ in RULES] + [DUPLICATE_RULE]
+        for name, count in zip(names, flags.sum(axis=0)):
+            self.failures[name] += int(count)
+        failed = flags.any(axis=1)
+        self.failed_rows += int(failed.sum())
+
+        if self.quarantine and rows is not None and failed.any():
+            failed_rules = pd.Series([';'.join(np.asarray(names)[row]) for row in flags[failed]],
+                                     index=rows.index[failed])
+            quarantined = rows[failed].assign(failed_rules=failed_rules)
+            quarantined.to_csv(self.quarantine, mode='a', index=False, header=not os.path.exists(self.quarantine))
+        return self
+
+    def summary(self):
+        """Table of the number and percentage of rows failing each rule."""
+        names = [name for name, _, _ in RULES] + [DUPLICATE_RULE]
+        table = pd.DataFrame({
+            'description': [RULE_DESCRIPTIONS[name] for name in names],
+            'failed_rows': [self.failures[name] for name in names],
+        }, index=pd.Index(names, name='rule'))
+        table.loc['any rule'] = ['at least one rule failed', self.failed_rows]
+        table['percent'] = table['failed_rows'] / self.rows * 100 if self.rows else np.nan
+        return table
+
+
+def check_chunk(raw, known_stations):
+    """Worker task: clean a raw chunk and return its trip ids and rule flags."""
+    trips = clean_trips(raw.copy(), errors='coerce')
+    return trips['trip_id'].to_numpy(), evaluate_rules(trips, known_stations)
+
+
+def validate_files(paths, workers=None, chunksize=CHUNK_SIZE, known_stations=None, quarantine=None):
+    """Check every chunk of the quarterly files in parallel; returns the Validator.
+
+    The rules of each chunk are evaluated by a worker process. With `quarantine` set to a CSV
+    path, the raw rows failing any rule are written there, with a 'failed_rules' column.
+    """
+    validator = Validator(known_stations, quarantine)
+    pending = collections.deque()
+
+    def tasks():
+        for raw in iter_raw_chunks(paths, chunksize=chunksize):
+            if quarantine:
+                pending.append(raw)
+            yield raw, known_stations
+
+    for trip_ids, flags in run_tasks(check_chunk, tasks(), workers):
+        validator.add_results(trip_ids, flags, pending.popleft() if quarantine else None)
+    return validator